@@ -1,14 +1,23 @@
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
+_GEMINI_KEY_RE = re.compile(r'^GEMINI_KEY_(\d+)$')
+
+def _gemini_keys_from_env():
+    """All non-empty GEMINI_KEY_<n> values, ordered by n"""
+    numbered = []
+    for name, value in os.environ.items():
+        match = _GEMINI_KEY_RE.match(name)
+        if match and value:
+            numbered.append((int(match.group(1)), value))
+    return [value for _, value in sorted(numbered)]
+
 class Config:
-    # API Keys
-    GEMINI_KEYS = [
-        os.getenv('GEMINI_KEY_1'),
-        os.getenv('GEMINI_KEY_2')
-    ]
+    # API Keys (GEMINI_KEY_1, GEMINI_KEY_2, ... - add more keys for more RPM)
+    GEMINI_KEYS = _gemini_keys_from_env()
     DEEPSEEK_KEY = os.getenv('DEEPSEEK_KEY')
     DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
     
@@ -42,14 +51,26 @@ class Config:
     # For 'package' mode: package pattern to match
     SCAN_PACKAGE = os.getenv('SCAN_PACKAGE', 'org/apache/roller/business')
     
-    # For 'manual' mode: specific files (comma-separated in .env)
-    MANUAL_FILES = os.getenv('MANUAL_FILES', '').split(',') if os.getenv('MANUAL_FILES') else []
+    # For 'manual' mode: specific files (comma-separated in .env), parsed once
+    MANUAL_FILES = tuple(f.strip() for f in os.getenv('MANUAL_FILES', '').split(',') if f.strip())
     
     # Maximum files to process per run (to avoid hitting rate limits)
     MAX_FILES_PER_RUN = int(os.getenv('MAX_FILES_PER_RUN', 10))
     
-    # Directories to exclude from scanning
-    EXCLUDE_DIRS = ['target', 'build', 'test', 'generated', '.git', 'node_modules']
+    # Files processed concurrently (work is I/O-bound on LLM/GitHub calls;
+    # the rate limiters still cap the actual request rate). Defaults to a
+    # quarter of the aggregate Gemini RPM, so it grows with each added key.
+    MAX_WORKERS = int(os.getenv('MAX_WORKERS', max(1, max(1, len(GEMINI_KEYS)) * GEMINI_RPM // 4)))
+    
+    # Small files are detected several per Gemini request (1 disables batching)
+    DETECT_BATCH_SIZE = int(os.getenv('DETECT_BATCH_SIZE', 1))
+    DETECT_BATCH_MAX_LINES = int(os.getenv('DETECT_BATCH_MAX_LINES', 200))
+    
+    # Estimated prompt tokens (chars / 4) allowed per batched request
+    DETECT_BATCH_TOKEN_BUDGET = int(os.getenv('DETECT_BATCH_TOKEN_BUDGET', 24000))
+    
+    # Directories to exclude from scanning (frozenset: O(1) membership per walk entry)
+    EXCLUDE_DIRS = frozenset({'target', 'build', 'test', 'generated', '.git', 'node_modules'})
     
     # ============================================
     
@@ -60,19 +81,44 @@ class Config:
     # State file location
     STATE_FILE = 'refactoring_reports/pipeline_state.json'
     
+    # Detection/refactoring results saved per file so resumed runs skip the LLM
+    ARTIFACT_CACHE_DIR = 'refactoring_reports/_cache'
+    
     # Maximum retry attempts for failed files
     MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
     
+    # Minimum seconds between state file writes (updates in between are coalesced)
+    STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', 5))
+    
     # Enable/disable state management
     ENABLE_STATE_MANAGEMENT = os.getenv('ENABLE_STATE_MANAGEMENT', 'true').lower() == 'true'
     
     # ============================================
     
+    # ============================================
+    # LLM RESPONSE CACHE
+    # ============================================
+    
+    # Reuse identical Gemini requests across files and runs
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_DIR = os.getenv('LLM_CACHE_DIR', '.cache/llm')
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600))
+    
+    # Only near-deterministic calls are cached (detection runs at 0.1,
+    # refactoring/revisions at 0.3 are expected to vary)
+    LLM_CACHE_MAX_TEMPERATURE = 0.1
+    
+    # ============================================
+    
+    # Estimated token cap per related file included as refactoring context
+    # (head and tail of the file are kept)
+    CONTEXT_FILE_MAX_TOKENS = int(os.getenv('CONTEXT_FILE_MAX_TOKENS', 2500))
+    
     @classmethod
     def validate(cls):
         missing = []
         if not any(cls.GEMINI_KEYS):
-            missing.append('GEMINI_KEY_1 or GEMINI_KEY_2')
+            missing.append('GEMINI_KEY_1 (or any GEMINI_KEY_<n>)')
         if not cls.GITHUB_TOKEN:
             missing.append('GITHUB_TOKEN')
         if not cls.LOCAL_REPO_PATH:
@@ -6,45 +6,50 @@ Automated Refactoring Pipeline with Dynamic File Discovery
 import os
 import json
 import sys
+import hashlib
 import signal
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import Config
 from utils.file_scanner import FileScanner
 from utils.state_manager import StateManager
-from pipeline.detector import SmellDetector
-from pipeline.refactorer import CodeRefactorer
-from pipeline.git_handler import GitHubHandler
-from pipeline.feedback_loop import FeedbackLoop
+
+# Serializes appends to the shared reports.ndjson across worker threads
+_reports_log_lock = threading.Lock()
 
 def save_report(detection, refactoring, output_dir):
-    """Save refactoring report with comment-only support"""
-    os.makedirs(output_dir, exist_ok=True)
-    
-    filename = detection['filename'].replace('.java', '')
+    """Save refactoring report with comment-only support (output_dir must exist)"""
+    # Strip only the extension (replace() also hit '.java' mid-name)
+    filename = os.path.splitext(detection['filename'])[0]
+    base = os.path.join(output_dir, filename)
     
     # Save original
-    with open(f"{output_dir}/{filename}_original.java", 'w') as f:
+    with open(f"{base}_original.java", 'w', encoding='utf-8') as f:
         f.write(detection['code'])
     
     # Check if comment-only mode
     is_comment_only = refactoring.get('is_comment_only', False)
     
     if is_comment_only:
-        # Save suggestions file
-        with open(f"{output_dir}/{filename}_refactoring_suggestions.md", 'w') as f:
-            f.write(f"# Refactoring Suggestions for {detection['filename']}\n\n")
-            f.write("**Multi-file changes required - manual refactoring recommended**\n\n")
-            f.write("## Detected Smells\n\n")
-            for smell in refactoring.get('smells', []):
-                f.write(f"- **{smell['type']}** ({smell['severity']})\n")
-            f.write("\n## Refactoring Guidance\n\n")
-            f.write(refactoring.get('suggestions', ''))
-        print(f"Multi-file refactoring - saved suggestions to {output_dir}/{filename}_refactoring_suggestions.md")
+        # Save suggestions file (built in memory, written once)
+        parts = [
+            f"# Refactoring Suggestions for {detection['filename']}\n\n",
+            "**Multi-file changes required - manual refactoring recommended**\n\n",
+            "## Detected Smells\n\n"
+        ]
+        parts.extend(f"- **{smell['type']}** ({smell['severity']})\n" for smell in refactoring.get('smells', []))
+        parts.append("\n## Refactoring Guidance\n\n")
+        parts.append(refactoring.get('suggestions') or '')
+        suggestions_path = f"{base}_refactoring_suggestions.md"
+        with open(suggestions_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(parts))
+        print(f"Multi-file refactoring - saved suggestions to {suggestions_path}")
     else:
         # Save refactored code (existing logic)
         for fname, code in refactoring.get('refactored_files', {}).items():
-            output_name = f"{filename}_refactored.java" if fname == 'main' else fname
-            with open(f"{output_dir}/{output_name}", 'w') as f:
+            output_path = f"{base}_refactored.java" if fname == 'main' else os.path.join(output_dir, fname)
+            with open(output_path, 'w', encoding='utf-8') as f:
                 f.write(code)
         print(f"Refactored code saved to {output_dir}/")
     
@@ -58,11 +63,35 @@ def save_report(detection, refactoring, output_dir):
         'files_created': list(refactoring.get('refactored_files', {}).keys())
     }
     
-    with open(f"{output_dir}/{filename}_metadata.json", 'w') as f:
-        json.dump(metadata, f, indent=2)
+    # One line per report in a single append-only log instead of a file per report
+    with _reports_log_lock:
+        with open(os.path.join(output_dir, 'reports.ndjson'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(metadata) + '\n')
+    
+    # Per-file metadata kept for existing consumers; reports.ndjson supersedes it
+    with open(f"{base}_metadata.json", 'w', encoding='utf-8') as f:
+        f.write(json.dumps(metadata, indent=2))
     
     return is_comment_only
 
+def _artifact_path(filepath, file_state, phase):
+    """Cache path for a phase result, keyed on file path and content hash"""
+    key = hashlib.sha1(f"{filepath}:{file_state.get('file_hash', '')}".encode()).hexdigest()[:16]
+    return os.path.join(Config.ARTIFACT_CACHE_DIR, f"{key}_{phase}.json")
+
+def save_artifact(filepath, file_state, phase, data):
+    """Persist a phase result so a resumed run can reuse it"""
+    with open(_artifact_path(filepath, file_state, phase), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data))
+
+def load_artifact(filepath, file_state, phase):
+    """Load a persisted phase result, or None if missing/unreadable"""
+    try:
+        with open(_artifact_path(filepath, file_state, phase), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Automated Refactoring Pipeline')
@@ -73,8 +102,9 @@ def parse_args():
     parser.add_argument('--monitor-interval', type=int, default=3600, help='Feedback check interval in seconds (default: 3600)')
     return parser.parse_args()
 
-# Global state manager for signal handler
+# Global state manager and worker pool for signal handler
 _state_manager = None
+_executor = None
 _interrupt_received = False
 
 def signal_handler(signum, frame):
@@ -89,17 +119,25 @@ def signal_handler(signum, frame):
     _interrupt_received = True
     print("\n\nInterrupt received, saving state...")
     
-    try:
-        if _state_manager:
-            _state_manager.complete_run()
-            _state_manager.print_summary()
-    except Exception as e:
-        print(f"Error saving state: {e}")
+    # Drop queued files; in-flight files finish their current phase
+    if _executor:
+        _executor.shutdown(wait=False, cancel_futures=True)
     
-    print("\nState saved. You can resume by running the script again.")
-    sys.exit(0)
+    # Don't save from inside the handler: the main thread may be interrupted
+    # while holding a state lock. Unwinding releases it; the state is saved
+    # by the KeyboardInterrupt handler at the bottom of this module.
+    raise KeyboardInterrupt
 
-def process_file_with_state(filepath, detector, refactorer, git_handler, state, feedback_loop=None, args=None):
+def _source_missing(error, filepath):
+    """
+    Whether an error means the source file itself was deleted since discovery
+    
+    Any other missing path (artifact cache, report dir, client files) is a
+    real failure and must go through the retry path, not be skipped.
+    """
+    return isinstance(error, FileNotFoundError) and error.filename == filepath
+
+def process_file_with_state(filepath, detector, refactorer, git_handler, state, feedback_loop=None, args=None, detections=None):
     """
     Process a single file with full state tracking
     
@@ -110,54 +148,60 @@ def process_file_with_state(filepath, detector, refactorer, git_handler, state,
     
     State is saved after each phase for resume capability
     """
-    import sys
     filename = os.path.basename(filepath)
     
-    print(f"Starting processing {filename}...", flush=True)
+    print(f"Starting processing {filename}...")
     
     # Start processing
     file_state = state.start_processing(filepath)
-    print(f"   Attempts: {file_state['attempts']}/{Config.MAX_RETRIES}", flush=True)
+    print(f"   Attempts: {file_state['attempts']}/{Config.MAX_RETRIES}")
     
     try:
         # ========== PHASE 1: SMELL DETECTION ==========
-        if not file_state['detection']['completed']:
-            print(f"\nAnalyzing {filename}...", flush=True)
-            detection = detector.analyze_file(filepath)
+        detection = None
+        if file_state['detection']['completed']:
+            # Resume: reuse the detection saved by the previous attempt
+            detection = load_artifact(filepath, file_state, 'detection')
+            if detection:
+                print(f"\nDetection already completed for {filename}")
+        
+        if detection is None:
+            # Batched detection (if any) already ran before the pool started
+            detection = (detections or {}).get(filepath)
+            if detection is None:
+                print(f"\nAnalyzing {filename}...")
+                detection = detector.analyze_file(filepath)
+            save_artifact(filepath, file_state, 'detection', detection)
             
             has_smells = detection['result'].get('has_smells', False)
-            state.mark_detection_complete(filepath, has_smells)
-            
-            if not has_smells:
-                print("No smells detected - skipping", flush=True)
-                state.mark_skipped(filepath, 'no_smells_detected')
-                return
-        else:
-            # Resume: Detection already done
-            print(f"\nDetection already completed for {filename}")
-            
-            # Reload detection data (simplified - in production could cache this)
-            detection = detector.analyze_file(filepath)
-            
-            if not file_state['detection'].get('has_smells'):
-                state.mark_skipped(filepath, 'no_smells_detected')
-                return
+            state.mark_detection_complete(filepath, has_smells, api_call=not detection.get('cached', False))
+        
+        # Artifacts saved before skip_refactor existed only carry has_smells
+        if detection.get('skip_refactor', not detection['result'].get('has_smells', False)):
+            print("No smells detected - skipping")
+            state.mark_skipped(filepath, 'no_smells_detected')
+            return
         
         # ========== PHASE 2A: REFACTOR WITH GEMINI ==========
         if not file_state['refactoring']['gemini']['completed']:
-            print(f"\n--- Refactoring with Gemini ---")
-            gemini_refactoring = refactorer.refactor(detection, use_model='gemini')
-            save_report(detection, gemini_refactoring, f"{Config.OUTPUT_DIR}/gemini")
+            gemini_refactoring = load_artifact(filepath, file_state, 'refactoring')
+            if gemini_refactoring:
+                print(f"\nReusing saved Gemini refactoring for {filename}")
+            else:
+                print(f"\n--- Refactoring with Gemini ---")
+                gemini_refactoring = refactorer.refactor(detection, use_model='gemini')
+                save_report(detection, gemini_refactoring, f"{Config.OUTPUT_DIR}/gemini")
+                save_artifact(filepath, file_state, 'refactoring', gemini_refactoring)
             
             # Don't mark complete yet - wait for PR creation
         else:
             print(f"\nGemini refactoring already completed for {filename}")
-            # Load from disk if needed for PR creation
-            gemini_refactoring = None  # Would reload from reports in production
+            # Reload from cache so a missing PR can still be created
+            gemini_refactoring = load_artifact(filepath, file_state, 'refactoring')
         
         # ========== PHASE 3A: CREATE PR (GEMINI VERSION) ==========
         if not file_state['refactoring']['gemini'].get('pr_number'):
-            if gemini_refactoring:  # Only if we just did refactoring
+            if gemini_refactoring:  # Only if we have a refactoring to submit
                 try:
                     print(f"\n--- Creating Pull Request (Gemini) ---")
                     pr = git_handler.create_pr(gemini_refactoring, filepath)
@@ -200,6 +244,12 @@ def process_file_with_state(filepath, detector, refactorer, git_handler, state,
         state.mark_completed(filepath)
     
     except Exception as e:
+        if _source_missing(e, filepath):
+            # Source file removed since discovery
+            print(f"WARNING: File not found, skipping...")
+            state.mark_skipped(filepath, 'file_not_found')
+            return
+        
         # Determine which phase failed
         phase = 'detection'
         if file_state['detection']['completed']:
@@ -214,11 +264,50 @@ def process_file_with_state(filepath, detector, refactorer, git_handler, state,
         # Don't crash - continue with next file
         return
 
+def process_file(idx, total, filepath, detector, refactorer, git_handler, state, feedback_loop=None, args=None, detections=None):
+    """
+    Process a single file (runs on a worker thread)
+    
+    Returns: 'completed', 'failed' or 'skipped' for the run statistics
+    """
+    print(f"\n{'='*70}")
+    print(f"[{idx}/{total}] {os.path.relpath(filepath, Config.LOCAL_REPO_PATH)}")
+    print(f"{'='*70}")
+    
+    # A file deleted since discovery surfaces as FileNotFoundError on open,
+    # so there's no separate existence check (one stat per file) here
+    if state:
+        # Outcome is tracked by the state manager
+        process_file_with_state(filepath, detector, refactorer, git_handler, state, feedback_loop, args, detections)
+        return None
+    
+    # Original non-state-aware processing
+    try:
+        detection = (detections or {}).get(filepath) or detector.analyze_file(filepath)
+        
+        if detection['skip_refactor']:
+            print("No smells detected - skipping")
+            return 'skipped'
+        
+        gemini_refactoring = refactorer.refactor(detection, use_model='gemini')
+        save_report(detection, gemini_refactoring, f"{Config.OUTPUT_DIR}/gemini")
+        
+        # Create PR
+        git_handler.create_pr(gemini_refactoring, filepath)
+        return 'completed'
+    
+    except Exception as e:
+        if _source_missing(e, filepath):
+            print(f"WARNING: File not found, skipping...")
+            return 'skipped'
+        print(f"ERROR: {e}")
+        return 'failed'
+
 def main():
     """
     Main pipeline execution with state management
     """
-    global _state_manager
+    global _state_manager, _executor
     
     # Parse CLI arguments
     args = parse_args()
@@ -232,7 +321,7 @@ def main():
     
     # Initialize state manager
     if Config.ENABLE_STATE_MANAGEMENT:
-        state = StateManager(Config.STATE_FILE, Config.MAX_RETRIES)
+        state = StateManager(Config.STATE_FILE, Config.MAX_RETRIES, Config.STATE_FLUSH_INTERVAL)
         _state_manager = state
         
         # Register signal handler for graceful shutdown
@@ -265,6 +354,7 @@ def main():
                 print(f"  Attempts: {f['attempts']}")
                 print(f"  Phase: {f['phase']}")
                 print(f"  Error: {f['error']}")
+                print(f"  Last failed: {f['last_failed']}")
         else:
             print("\nNo failed files")
         return
@@ -275,16 +365,27 @@ def main():
         state.print_summary()
         input("\nPress Enter to continue (or Ctrl+C to cancel)...")
     
+    # Pipeline stages pull in the LLM and GitHub SDKs - import only when running
+    from models.gemini_client import GeminiClient
+    from pipeline.detector import SmellDetector
+    from pipeline.refactorer import CodeRefactorer
+    from pipeline.git_handler import GitHubHandler
+    from pipeline.feedback_loop import FeedbackLoop
+    
     # Initialize components
     scanner = FileScanner()
-    detector = SmellDetector()
-    refactorer = CodeRefactorer()
+    
+    # One Gemini client for all stages: keep-alive connections are reused and
+    # the rate limiter sees every request, not just one stage's share
+    gemini = GeminiClient()
+    detector = SmellDetector(gemini)
+    refactorer = CodeRefactorer(gemini)
     git_handler = GitHubHandler()
     
     # Initialize feedback loop if monitoring enabled
     feedback_loop = None
     if args.monitor:
-        feedback_loop = FeedbackLoop(git_handler)
+        feedback_loop = FeedbackLoop(git_handler, gemini)
         print(f"Feedback monitoring enabled (check interval: {args.monitor_interval}s)")
     
     # Discover files
@@ -294,6 +395,10 @@ def main():
         print("WARNING: No files found to scan!")
         return
     
+    # Hash candidates in parallel so the state checks below only stat them
+    if state:
+        state.precompute_hashes(files_to_scan, Config.MAX_WORKERS)
+    
     # Filter files based on state
     remaining_files = []
     skipped_count = 0
@@ -328,49 +433,45 @@ def main():
         'skipped': 0
     }
     
-    # Process each file
-    for idx, filepath in enumerate(remaining_files, 1):
-        print(f"\n{'='*70}")
-        print(f"[{idx}/{len(remaining_files)}] {os.path.relpath(filepath, Config.LOCAL_REPO_PATH)}")
-        print(f"{'='*70}")
+    # Create output directories once, not per saved report
+    os.makedirs(f"{Config.OUTPUT_DIR}/gemini", exist_ok=True)
+    os.makedirs(Config.ARTIFACT_CACHE_DIR, exist_ok=True)
+    
+    # Process files concurrently - each file is dominated by LLM/GitHub round-trips
+    with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS) as executor:
+        _executor = executor
         
-        # Check if file still exists
-        if not os.path.exists(filepath):
-            print(f"WARNING: File not found, skipping...")
-            if state:
-                state.mark_skipped(filepath, 'file_not_found')
-            stats['skipped'] += 1
-            continue
+        # Detect small files several per request before per-file processing
+        detections = {}
+        if Config.DETECT_BATCH_SIZE > 1:
+            pending = [f for f in remaining_files if not state or state.needs_detection(f)]
+            # One slice per worker; each slice is split into batches by the detector
+            per_worker = max(Config.DETECT_BATCH_SIZE, -(-len(pending) // Config.MAX_WORKERS))
+            slices = [pending[i:i + per_worker] for i in range(0, len(pending), per_worker)]
+            for batch_result in executor.map(lambda s: detector.analyze_batch(s, Config.DETECT_BATCH_SIZE), slices):
+                detections.update(batch_result)
         
-        # Process with full error handling
-
-        if state:
-            process_file_with_state(filepath, detector, refactorer, git_handler, state, feedback_loop, args)
-        else:
-            # Original non-state-aware processing
+        futures = {
+            executor.submit(process_file, idx, len(remaining_files), filepath,
+                            detector, refactorer, git_handler, state, feedback_loop, args, detections): filepath
+            for idx, filepath in enumerate(remaining_files, 1)
+        }
+        
+        for future in as_completed(futures):
             try:
-                detection = detector.analyze_file(filepath)
-                
-                if not detection['result'].get('has_smells'):
-                    print("No smells detected - skipping")
-                    stats['skipped'] += 1
-                    continue
-                
-                # Refactor with both models
-                gemini_refactoring = refactorer.refactor(detection, use_model='gemini')
-                save_report(detection, gemini_refactoring, f"{Config.OUTPUT_DIR}/gemini")
-                
-
-                
-                # Create PR
-                pr = git_handler.create_pr(gemini_refactoring, filepath)
-                stats['completed'] += 1
-            
+                outcome = future.result()
             except Exception as e:
-                print(f"ERROR: {e}")
-                stats['failed'] += 1
-        
-        stats['processed'] += 1
+                print(f"ERROR: {os.path.basename(futures[future])}: {e}")
+                outcome = 'failed'
+            
+            if outcome in stats:
+                stats[outcome] += 1
+            if outcome != 'skipped':
+                stats['processed'] += 1
+            
+            # One flush per finished file instead of one per progress line
+            sys.stdout.flush()
+    _executor = None
     
     # Final summary
     if state:
@@ -386,15 +487,27 @@ def main():
         print(f"Skipped:          {stats['skipped']}")
         print(f"\nReports saved to:  {Config.OUTPUT_DIR}/")
         print("="*70)
+    
+    # Only near-deterministic (detection) calls are cached
+    if detector.gemini.cache:
+        cache_stats = detector.gemini.cache.stats
+        print(f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print("\n\nInterrupted by user")
+        if not _interrupt_received:
+            print("\n\nInterrupted by user")
         if _state_manager:
-            _state_manager.complete_run()
-        sys.exit(1)
+            try:
+                _state_manager.complete_run()
+                _state_manager.print_summary()
+                print("\nState saved. You can resume by running the script again.")
+            except Exception as e:
+                print(f"Error saving state: {e}")
+        # SIGINT/SIGTERM through signal_handler is a graceful shutdown
+        sys.exit(0 if _interrupt_received else 1)
     except Exception as e:
         print(f"\nFatal error: {e}")
         if _state_manager:
@@ -1,8 +1,21 @@
 """
 Models package for AI client wrappers
 """
-from .gemini_client import GeminiClient
-from .deepseek_client import DeepSeekClient
-from .rate_limiter import RateLimiter
+import importlib
 
-__all__ = ['GeminiClient', 'DeepSeekClient', 'RateLimiter']
+# Clients are imported on first access (PEP 562) so that code paths which
+# never call an LLM (e.g. --stats) don't pay for the provider SDK imports
+_LAZY_EXPORTS = {
+    'GeminiClient': '.gemini_client',
+    'DeepSeekClient': '.deepseek_client',
+    'RateLimiter': '.rate_limiter',
+    'LLMCache': '.llm_cache',
+}
+
+__all__ = ['GeminiClient', 'DeepSeekClient', 'RateLimiter', 'LLMCache']
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        module = importlib.import_module(_LAZY_EXPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,38 @@
 import requests
 import json
-import re
 from config import Config
+from utils.response_parser import ResponseParser
 from .rate_limiter import RateLimiter
 
+# Static detection prompt; the source code is appended after formatting
+_DETECT_SMELLS_PROMPT = """Analyze this Java file for design smells. The file has {line_count} lines.
+
+Look for these smells:
+1. God Class (>400 lines, too many responsibilities)
+2. Long Method (>30 lines)
+3. Feature Envy
+4. Data Clumps
+
+Return ONLY valid JSON in this format:
+{{
+  "has_smells": true,
+  "smells": [
+    {{
+      "type": "God Class",
+      "severity": "high",
+      "line_range": "1-{line_count}",
+      "evidence": "description",
+      "affected_methods": ["method1", "method2"]
+    }}
+  ]
+}}
+
+If no smells: {{"has_smells": false, "smells": []}}
+
+File: {filename} ({line_count} lines)
+
+"""
+
 class DeepSeekClient:
     """
     DeepSeek API client (code-specialized)
@@ -13,17 +42,19 @@ class DeepSeekClient:
         self.api_key = Config.DEEPSEEK_KEY
         self.rate_limiter = RateLimiter(rpm_limit=Config.DEEPSEEK_RPM, num_keys=1)
         
+        # Keep-alive session so TCP/TLS setup is paid once, not per call
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+        
         print(f"✅ Initialized DeepSeek (60 RPM)")
     
     def generate(self, prompt, temperature=0.3):
         """Call DeepSeek API"""
         self.rate_limiter.wait_if_needed()
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "model": "deepseek-chat",
             "messages": [
@@ -34,8 +65,8 @@ class DeepSeekClient:
         }
         
         try:
-            print(f"🔄 Calling DeepSeek...", flush=True)
-            response = requests.post(self.api_url, headers=headers, json=payload, timeout=120)
+            print(f"🔄 Calling DeepSeek...")
+            response = self.session.post(self.api_url, json=payload, timeout=120)
             response.raise_for_status()
             
             result = response.json()['choices'][0]['message']['content']
@@ -48,65 +79,41 @@ class DeepSeekClient:
     
     def extract_json(self, text):
         """Extract JSON from text that might have markdown or extra content"""
-        # Try direct parse
-        try:
-            return json.loads(text)
-        except json.JSONDecodeError:
-            pass
-        
-        # Try extracting from markdown code block
-        json_match = re.search(r'```(?:json)?\s*([\s\S]*?)```', text)
-        if json_match:
+        # Try direct parse, only when the reply actually starts like JSON
+        stripped = text.lstrip()
+        if stripped.startswith(('{', '[')):
             try:
-                return json.loads(json_match.group(1))
+                return json.loads(stripped)
             except json.JSONDecodeError:
                 pass
         
-        # Try to find JSON object in text
-        json_match = re.search(r'\{[\s\S]*\}', text)
-        if json_match:
+        # Try extracting from markdown code block
+        block = ResponseParser.extract_fenced_block(text)
+        if block:
             try:
-                return json.loads(json_match.group(0))
+                return json.loads(block)
             except json.JSONDecodeError:
                 pass
         
+        # Try to find JSON object in text
+        result = ResponseParser.find_json_object(text)
+        if result is not None:
+            return result
+        
         return {"has_smells": False, "smells": []}
     
     def detect_smells(self, code, filename):
-        """Detect design smells using DeepSeek (fallback for Gemini)"""
-        line_count = len(code.splitlines())
+        """
+        Detect design smells using DeepSeek (fallback for Gemini)
+        Returns: parsed result dict
+        """
+        # Count newlines instead of materializing a list of lines
+        line_count = code.count('\n') + (1 if code and not code.endswith('\n') else 0)
         
-        prompt = f"""Analyze this Java file for design smells. The file has {line_count} lines.
-
-Look for these smells:
-1. God Class (>400 lines, too many responsibilities)
-2. Long Method (>30 lines)
-3. Feature Envy
-4. Data Clumps
-
-Return ONLY valid JSON in this format:
-{{
-  "has_smells": true,
-  "smells": [
-    {{
-      "type": "God Class",
-      "severity": "high",
-      "line_range": "1-{line_count}",
-      "evidence": "description",
-      "affected_methods": ["method1", "method2"]
-    }}
-  ]
-}}
-
-If no smells: {{"has_smells": false, "smells": []}}
-
-File: {filename} ({line_count} lines)
-
-{code}
-"""
+        # Only the small header is formatted; the (possibly large) source is appended once
+        prompt = _DETECT_SMELLS_PROMPT.format(line_count=line_count, filename=filename) + code + "\n"
         response = self.generate(prompt)
-        result = self.extract_json(response)
-        return json.dumps(result)
+        return self.extract_json(response)
     
     def refactor_code(self, code, smells_json):
         """Refactor using DeepSeek"""
@@ -1,10 +1,136 @@
 from google import genai
+from google.genai import types
+import httpx
 from config import Config
+from utils.response_parser import ResponseParser
 from .rate_limiter import RateLimiter
+from .llm_cache import LLMCache
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import json
 import re
+import threading
 import time
 
+# API calls run here so the caller can bound them with future.result(timeout)
+# on any platform and from any thread (SIGALRM only worked on Unix, main thread).
+# The HTTP transport timeout is what actually aborts a stalled call and frees
+# the worker; the future timeout is only a backstop.
+_API_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(8, 2 * len(Config.GEMINI_KEYS), Config.MAX_WORKERS),
+    thread_name_prefix='gemini-api'
+)
+
+# Stall timeouts (max seconds without a new chunk) per model type
+_STALL_TIMEOUTS = {'flash': 300, 'pro': 600}
+
+# Extra wait on the future beyond the transport timeout, so the transport
+# normally gives up first and the worker thread is released with it
+_BACKSTOP_GRACE = 30
+
+_RETRY_DELAY_RE = re.compile(r'retryDelay["\s:]+(\d+)')
+_json_loads = json.loads
+
+# Map model type to actual model name
+_MODEL_MAP = {
+    'flash': 'gemini-flash-lite-latest',
+    'pro': 'gemini-flash-latest'
+}
+
+@lru_cache(maxsize=256)
+def _truncate_by_tokens(text, max_tokens=2500, head_frac=0.6):
+    """
+    Cap text at roughly max_tokens, keeping whole lines from the top and bottom
+    
+    Tokens are estimated as chars / 4. The head keeps the package, imports and
+    public API; the tail keeps the last members and closing braces.
+    """
+    if len(text) // 4 <= max_tokens:
+        return text
+    
+    lines = text.splitlines(keepends=True)
+    head_budget = int(max_tokens * head_frac) * 4
+    tail_budget = max_tokens * 4 - head_budget
+    
+    head_end, used = 0, 0
+    while head_end < len(lines) and used + len(lines[head_end]) <= head_budget:
+        used += len(lines[head_end])
+        head_end += 1
+    
+    tail_start, used = len(lines), 0
+    while tail_start > head_end and used + len(lines[tail_start - 1]) <= tail_budget:
+        tail_start -= 1
+        used += len(lines[tail_start])
+    
+    omitted = tail_start - head_end
+    return ''.join(lines[:head_end]) + f"\n// ... {omitted} lines omitted ...\n\n" + ''.join(lines[tail_start:])
+
+# Smell catalogue and output schema - identical for every file
+_DETECT_SMELLS_PREFIX = """You are a strict senior software architect specializing in detecting DESIGN SMELLS (not code smells).
+
+Analyze this Java file for design smells across FOUR categories. Be THOROUGH:
+
+## 1. ABSTRACTION SMELLS
+**Missing Abstraction**: Primitive types where domain objects should exist, magic numbers/strings
+**Imperative Abstraction**: Names reflect "how" not "what" (ProcessData vs domain concepts)
+**Incomplete Abstraction**: Missing essential methods/properties
+**Multifaceted Abstraction**: Single class with too many responsibilities (God Class)
+**Unnecessary Abstraction**: Wrappers with no value
+**Unutilized Abstraction**: Defined but unused
+**Duplicate Abstraction**: Multiple classes representing same concept
+
+## 2. ENCAPSULATION SMELLS
+**Deficient Encapsulation**: Public fields instead of private with getters/setters
+**Leaky Encapsulation**: Internal implementation exposed via public API
+**Missing Encapsulation**: Anemic models (only getters/setters, no logic)
+**Unexploited Encapsulation**: Access modifiers not used properly
+
+## 3. MODULARIZATION SMELLS
+**Broken Modularization**: Depends on other module internals
+**Insufficient Modularization**: Monolithic, should be split
+**Cyclically-dependent Modularization**: A depends on B depends on A
+**Hub-like Modularization**: Central hub everything depends on
+
+## 4. HIERARCHY SMELLS
+**Missing Hierarchy**: Code duplication that should use inheritance
+**Deep Hierarchy**: More than 4-5 levels
+**Unnecessary Hierarchy**: Inheritance where composition better
+**Rebellious Hierarchy**: Subclass violates parent contract (LSP)
+**Unfactored Hierarchy**: Common code not in parent
+**Broken Hierarchy**: is-a relationship violated
+**Wide Hierarchy**: Too many direct children (>10)
+**Multipath Hierarchy**: Diamond problem
+**Speculative Hierarchy**: Built for future needs
+**Cyclic Hierarchy**: Circular inheritance dependencies
+
+Return JSON:
+{
+  "has_smells": true,
+  "smells": [
+    {
+      "type": "Multifaceted Abstraction",
+      "category": "Abstraction",
+      "severity": "high",
+      "line_range": "1-120",
+      "evidence": "Class handles user management, logging, and email notifications",
+      "affected_elements": ["UserManager", "sendEmail", "logActivity"]
+    }
+  ]
+}
+
+"""
+
+# Replaces the single-file output format when several files share one request
+_DETECT_SMELLS_BATCH_INSTRUCTIONS = """The input below contains SEVERAL Java files, each wrapped in <FILE name="..." lines="...">...</FILE>.
+Analyze every file independently and return ONE entry per file instead of the single-file format above:
+{
+  "files": [
+    {"filename": "Foo.java", "has_smells": true, "smells": [...]}
+  ]
+}
+
+"""
+
 class GeminiClient:
     """
     Gemini client with automatic key rotation
@@ -15,7 +141,11 @@ class GeminiClient:
         
         # Configure each key
         for key in self.keys:
-            client = genai.Client(api_key=key)
+            # Default transport timeout; each request also sets its own
+            client = genai.Client(
+                api_key=key,
+                http_options=types.HttpOptions(timeout=max(_STALL_TIMEOUTS.values()) * 1000)
+            )
             self.clients.append(client)
         
         self.rate_limiter = RateLimiter(
@@ -23,106 +153,122 @@ class GeminiClient:
             num_keys=len(self.keys)
         )
         
+        # Shared on-disk response cache (None when disabled)
+        self.cache = LLMCache(Config.LLM_CACHE_DIR, Config.LLM_CACHE_TTL) if Config.LLM_CACHE_ENABLED else None
+        
+        # Per-thread: whether the last generate() was served from the cache
+        self._local = threading.local()
+        
         print(f"Initialized Gemini with {len(self.keys)} keys (Effective rate: {len(self.keys) * Config.GEMINI_RPM} RPM)")
     
     def extract_json(self, text):
         """
         Extract JSON from LLM response that might contain markdown or extra text
         """
+        result = self._parse_json(text)
+        if result is not None:
+            return result
+        
+        # Give up - return safe default
+        print(f"WARNING: Could not extract JSON from response, using default")
+        return {"has_smells": False, "smells": []}
+    
+    def _parse_json(self, text):
+        """JSON value found in an LLM response, or None"""
         # Try to parse directly first
         try:
-            return json.loads(text)
+            return _json_loads(text)
         except json.JSONDecodeError:
             pass
         
         # Try to extract from markdown code blocks
-        json_match = re.search(r'```(?:json)?\s*({.*?})\s*```', text, re.DOTALL)
-        if json_match:
+        block = ResponseParser.extract_fenced_block(text)
+        if block:
             try:
-                return json.loads(json_match.group(1))
+                return _json_loads(block)
             except json.JSONDecodeError:
                 pass
         
-        # Try to find JSON object in text
-        json_match = re.search(r'{.*}', text, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(0))
-            except json.JSONDecodeError:
-                pass
-        
-        # Give up - return safe default
-        print(f"WARNING: Could not extract JSON from response, using default")
-        return {"has_smells": False, "smells": []}
+        # Try to find JSON object in text (linear scan, no backtracking)
+        return ResponseParser.find_json_object(text)
+    
+    def _is_detection(self, text):
+        """Cache validator: a single-file detection reply"""
+        parsed = self._parse_json(text)
+        return isinstance(parsed, dict) and 'has_smells' in parsed
+    
+    def _is_batch_detection(self, text):
+        """Cache validator: a batched detection reply"""
+        parsed = self._parse_json(text)
+        return isinstance(parsed, list) or (isinstance(parsed, dict) and 'files' in parsed)
     
-    def generate(self, prompt, model_type='flash', temperature=0.1, json_mode=False):
+    def served_from_cache(self):
+        """Whether the last generate() call on this thread was a cache hit"""
+        return getattr(self._local, 'cache_hit', False)
+    
+    def generate(self, prompt, model_type='flash', temperature=0.1, json_mode=False, validate=None):
         """
         Generate with automatic key rotation
+        
+        Near-deterministic requests are served from the response cache
+        without touching the rate limiter or the API. When validate is
+        given, only responses it accepts are cached or served from the
+        cache, so an unparseable reply is not replayed for the whole TTL.
         """
+        model_name = _MODEL_MAP.get(model_type, 'gemini-flash-lite-latest')
+        self._local.cache_hit = False
+        
+        cache_key = None
+        if self.cache and temperature <= Config.LLM_CACHE_MAX_TEMPERATURE:
+            cache_key = LLMCache.make_key(model_name, prompt, temperature, json_mode)
+            cached = self.cache.get(cache_key)
+            if cached is not None and (validate is None or validate(cached)):
+                print(f"Gemini {model_type}: Cache hit ({len(cached)} chars)")
+                self._local.cache_hit = True
+                return cached
+        
         key_idx = self.rate_limiter.wait_if_needed()
         
-        # Map model type to actual model name
-        model_map = {
-            'flash': 'gemini-flash-lite-latest',
-            'pro': 'gemini-flash-latest'
-        }
-        model_name = model_map.get(model_type, 'gemini-flash-lite-latest')
+        # Stall timeout (max seconds without a new chunk) based on model type
+        timeout = _STALL_TIMEOUTS.get(model_type, _STALL_TIMEOUTS['pro'])
         
-        # Timeout based on model type
-        timeout = 300 if model_type == 'flash' else 600  # 2min for flash, 5min for pro
+        # httpx applies the timeout per read, so a streaming call is aborted
+        # once no bytes arrive for that long
+        config = {
+            'temperature': temperature,
+            'http_options': {'timeout': timeout * 1000}
+        }
+        if json_mode:
+            config['response_mime_type'] = 'application/json'
         
         # Retry loop for rate limits
         max_retries = 3
         for attempt in range(max_retries):
-            print(f"Calling Gemini {model_type} (key {key_idx + 1})...", flush=True)
+            print(f"Calling Gemini {model_type} (key {key_idx + 1})...")
             
             try:
                 client = self.clients[key_idx]
                 
-                config = {
-                    'temperature': temperature
-                }
-                if json_mode:
-                    config['response_mime_type'] = 'application/json'
-                
-                # Add timeout to prevent hanging
-                import signal
-                import platform
+                # Stream on the API executor; every chunk refreshes the progress
+                # time, so only a stalled stream times out
+                progress = [time.monotonic()]
+                future = _API_EXECUTOR.submit(self._stream_text, client, model_name, prompt, config, progress)
+                text = self._await_stream(future, progress, timeout + _BACKSTOP_GRACE)
                 
-                response = None
-                if platform.system() != 'Windows':
-                    # Unix-like systems support signal timeout
-                    def timeout_handler(signum, frame):
-                        raise TimeoutError(f"Gemini API call timed out after {timeout} seconds")
-                    
-                    old_handler = signal.signal(signal.SIGALRM, timeout_handler)
-                    signal.alarm(timeout)
-                    
-                    try:
-                        response = client.models.generate_content(
-                            model=model_name,
-                            contents=prompt,
-                            config=config
-                        )
-                    finally:
-                        signal.alarm(0)  # Cancel alarm
-                        signal.signal(signal.SIGALRM, old_handler)
-                else:
-                    # Windows - no timeout
-                    response = client.models.generate_content(
-                        model=model_name,
-                        contents=prompt,
-                        config=config
-                    )
-                
-                if not response or not response.text:
+                if not text:
                     raise ValueError("Empty response from Gemini")
                 
-                print(f"Gemini {model_type}: Success ({len(response.text)} chars)")
-                return response.text
+                print(f"Gemini {model_type}: Success ({len(text)} chars)")
+                if cache_key and (validate is None or validate(text)):
+                    self.cache.set(cache_key, text)
+                return text
             
             except TimeoutError as e:
                 print(f"Gemini timeout: {e}")
+                if attempt < max_retries - 1:
+                    # Retry on the next key
+                    key_idx = (key_idx + 1) % len(self.clients)
+                    continue
                 raise
             except Exception as e:
                 error_str = str(e)
@@ -131,8 +277,7 @@ class GeminiClient:
                     # Extract retry delay from error if available
                     wait_time = 30 * (attempt + 1)  # Exponential backoff: 30s, 60s, 90s
                     if 'retryDelay' in error_str:
-                        import re
-                        match = re.search(r'retryDelay["\s:]+(\d+)', error_str)
+                        match = _RETRY_DELAY_RE.search(error_str)
                         if match:
                             wait_time = int(match.group(1)) + 5  # Add 5 seconds buffer
                     
@@ -148,74 +293,88 @@ class GeminiClient:
         
         raise Exception(f"Failed after {max_retries} retries due to rate limits")
     
+    def _await_stream(self, future, progress, timeout):
+        """
+        Wait for a streaming call, failing once no chunk arrived for timeout seconds
+        """
+        while True:
+            remaining = progress[0] + timeout - time.monotonic()
+            if remaining <= 0:
+                future.cancel()
+                raise TimeoutError(f"Gemini API call stalled for {timeout} seconds")
+            try:
+                return future.result(timeout=remaining)
+            except FutureTimeoutError:
+                # Same class as TimeoutError on 3.11+: re-raise errors from the call itself
+                if future.done():
+                    raise
+    
+    def _stream_text(self, client, model_name, prompt, config, progress=None):
+        """
+        Stream a completion and return the joined text
+        
+        progress[0] (if given) is set to time.monotonic() after every chunk.
+        """
+        chunks = []
+        try:
+            for chunk in client.models.generate_content_stream(
+                model=model_name,
+                contents=prompt,
+                config=config
+            ):
+                if chunk.text:
+                    chunks.append(chunk.text)
+                if progress is not None:
+                    progress[0] = time.monotonic()
+        except httpx.TimeoutException as e:
+            # Transport gave up on a stalled call; retried like a stall timeout
+            raise TimeoutError(f"Gemini API call stalled: {type(e).__name__}") from e
+        return ''.join(chunks)
+    
     def detect_smells(self, code, filename):
-        """Detect design smells using Flash (faster)"""
-        line_count = len(code.splitlines())
+        """
+        Detect design smells using Flash (faster)
+        Returns: parsed result dict
+        """
+        # Count newlines instead of materializing a list of lines
+        line_count = code.count('\n') + (1 if code and not code.endswith('\n') else 0)
         
-        prompt = f"""You are a strict senior software architect specializing in detecting DESIGN SMELLS (not code smells).
-
-Analyze this Java file ({line_count} lines) for design smells across FOUR categories. Be THOROUGH:
-
-## 1. ABSTRACTION SMELLS
-**Missing Abstraction**: Primitive types where domain objects should exist, magic numbers/strings
-**Imperative Abstraction**: Names reflect "how" not "what" (ProcessData vs domain concepts)
-**Incomplete Abstraction**: Missing essential methods/properties
-**Multifaceted Abstraction**: Single class with too many responsibilities (God Class)
-**Unnecessary Abstraction**: Wrappers with no value
-**Unutilized Abstraction**: Defined but unused
-**Duplicate Abstraction**: Multiple classes representing same concept
-
-## 2. ENCAPSULATION SMELLS
-**Deficient Encapsulation**: Public fields instead of private with getters/setters
-**Leaky Encapsulation**: Internal implementation exposed via public API
-**Missing Encapsulation**: Anemic models (only getters/setters, no logic)
-**Unexploited Encapsulation**: Access modifiers not used properly
-
-## 3. MODULARIZATION SMELLS
-**Broken Modularization**: Depends on other module internals
-**Insufficient Modularization**: Monolithic, should be split
-**Cyclically-dependent Modularization**: A depends on B depends on A
-**Hub-like Modularization**: Central hub everything depends on
-
-## 4. HIERARCHY SMELLS
-**Missing Hierarchy**: Code duplication that should use inheritance
-**Deep Hierarchy**: More than 4-5 levels
-**Unnecessary Hierarchy**: Inheritance where composition better
-**Rebellious Hierarchy**: Subclass violates parent contract (LSP)
-**Unfactored Hierarchy**: Common code not in parent
-**Broken Hierarchy**: is-a relationship violated
-**Wide Hierarchy**: Too many direct children (>10)
-**Multipath Hierarchy**: Diamond problem
-**Speculative Hierarchy**: Built for future needs
-**Cyclic Hierarchy**: Circular inheritance dependencies
-
-Return JSON:
-{{
-  "has_smells": true,
-  "smells": [
-    {{
-      "type": "Multifaceted Abstraction",
-      "category": "Abstraction",
-      "severity": "high",
-      "line_range": "1-{line_count}",
-      "evidence": "Class handles user management, logging, and email notifications",
-      "affected_elements": ["UserManager", "sendEmail", "logActivity"]
-    }}
-  ]
-}}
-
-File: {filename} ({line_count} lines)
-
-{code}"""
-        response = self.generate(prompt, model_type='flash', json_mode=True)
+        # Static prefix first, per-file data last: identical leading tokens
+        # let the provider's implicit prefix cache reuse the catalogue
+        prompt = f"{_DETECT_SMELLS_PREFIX}File: {filename} ({line_count} lines)\n\n{code}"
+        response = self.generate(prompt, model_type='flash', json_mode=True, validate=self._is_detection)
         
         # Extract JSON even if response includes extra text
         try:
-            result = self.extract_json(response)
-            return json.dumps(result)
+            return self.extract_json(response)
         except Exception as e:
             print(f"WARNING: JSON extraction failed: {e}")
-            return json.dumps({"has_smells": False, "smells": []})
+            return {"has_smells": False, "smells": []}
+    
+    def detect_smells_batch(self, files):
+        """
+        Detect design smells in several files with one Flash request
+        
+        files: list of (filename, code) with unique filenames
+        Returns: {filename: result} for the files present in the response
+        """
+        sections = []
+        for filename, code in files:
+            line_count = code.count('\n') + (1 if code and not code.endswith('\n') else 0)
+            sections.append(f'<FILE name="{filename}" lines="{line_count}">\n{code}\n</FILE>\n')
+        
+        prompt = _DETECT_SMELLS_PREFIX + _DETECT_SMELLS_BATCH_INSTRUCTIONS + '\n'.join(sections)
+        response = self.generate(prompt, model_type='flash', json_mode=True, validate=self._is_batch_detection)
+        
+        parsed = self.extract_json(response)
+        entries = parsed.get('files', []) if isinstance(parsed, dict) else parsed
+        
+        wanted = {filename for filename, _ in files}
+        results = {}
+        for entry in entries if isinstance(entries, list) else []:
+            if isinstance(entry, dict) and entry.get('filename') in wanted:
+                results[entry.pop('filename')] = entry
+        return results
     
     def refactor_code(self, code, smells_json, context_files=None):
         """Refactor using Pro with multi-file impact detection"""
@@ -223,7 +382,7 @@ File: {filename} ({line_count} lines)
         if context_files:
             context = "\n\nRELATED FILES FOR CONTEXT:\n"
             for fname, content in context_files.items():
-                context += f"\n--- {fname} ---\n{content[:10000]}\n"
+                context += f"\n--- {fname} ---\n{_truncate_by_tokens(content, Config.CONTEXT_FILE_MAX_TOKENS)}\n"
         
         prompt = f"""
 You are an expert Java refactoring engineer.
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+class LLMCache:
+    """
+    Exact-match, disk-backed cache for LLM responses
+    
+    Entries are keyed on the full request (model, prompt, temperature,
+    json_mode) and stored one JSON file per key; entries older than
+    ttl seconds are treated as misses.
+    """
+    def __init__(self, cache_dir, ttl):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(model, prompt, temperature, json_mode):
+        """SHA-256 over a canonical encoding of the request"""
+        payload = json.dumps({
+            'model': model,
+            'prompt': prompt,
+            'temperature': temperature,
+            'json_mode': json_mode
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+    
+    def get(self, key):
+        """Return the cached response text, or None on miss/expiry"""
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if time.time() - entry['created_at'] <= self.ttl:
+                self._count('hits')
+                return entry['response']
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+        
+        self._count('misses')
+        return None
+    
+    def set(self, key, response):
+        """Store a response (atomic write; failures only warn)"""
+        path = self._path(key)
+        temp_file = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'created_at': time.time(), 'response': response}))
+            os.replace(temp_file, path)
+        except OSError as e:
+            print(f"WARNING: Failed to write LLM cache entry: {e}")
@@ -1,19 +1,31 @@
+import heapq
 import time
-from collections import deque
+from array import array
 from threading import Lock
 
+# Sliding window length in monotonic nanoseconds
+_WINDOW_NS = 60 * 1_000_000_000
+
 class RateLimiter:
     """
     Thread-safe rate limiter with key rotation
+    
+    Each key keeps a fixed ring of its last rpm_limit request times; the
+    key has capacity when the oldest slot is more than a minute old. A
+    min-heap of (next free time, key) makes picking a key O(log K).
     """
     def __init__(self, rpm_limit, num_keys=1):
         self.rpm_limit = rpm_limit
         self.num_keys = num_keys
         self.effective_rpm = rpm_limit * num_keys
         
-        # Separate tracking per key
-        self.request_times = {i: deque() for i in range(num_keys)}
-        self.current_key_index = 0
+        # Separate tracking per key (slots start "a window ago", i.e. free)
+        self.request_times = [array('q', [-_WINDOW_NS] * rpm_limit) for _ in range(num_keys)]
+        self.ring_heads = [0] * num_keys
+        
+        # (monotonic ns when the key next has capacity, last use, key index);
+        # the last-use tie-break keeps rotating through keys that are all free
+        self.ready_heap = [(0, 0, key_idx) for key_idx in range(num_keys)]
         self.lock = Lock()
     
     def wait_if_needed(self):
@@ -21,32 +33,26 @@ class RateLimiter:
         Blocks until it's safe to make a request
         Returns the key index to use
         """
-        with self.lock:
-            current_time = time.time()
-            
-            # Try to find a key that's ready
-            for attempt in range(self.num_keys):
-                key_idx = (self.current_key_index + attempt) % self.num_keys
-                times = self.request_times[key_idx]
+        while True:
+            with self.lock:
+                current_time = time.monotonic_ns()
+                free_at, _, key_idx = self.ready_heap[0]
                 
-                # Clean old requests (older than 60 seconds)
-                while times and current_time - times[0] > 60:
-                    times.popleft()
-                
-                # Check if this key has capacity
-                if len(times) < self.rpm_limit:
-                    times.append(current_time)
-                    self.current_key_index = (key_idx + 1) % self.num_keys
+                if current_time >= free_at:
+                    # Record the request in this key's ring
+                    ring = self.request_times[key_idx]
+                    head = self.ring_heads[key_idx]
+                    ring[head] = current_time
+                    head = (head + 1) % self.rpm_limit
+                    self.ring_heads[key_idx] = head
+                    
+                    # Key is free again once its (new) oldest slot leaves the window
+                    heapq.heapreplace(self.ready_heap, (ring[head] + _WINDOW_NS, current_time, key_idx))
                     return key_idx
+                
+                # All keys at limit - must wait for the earliest one
+                sleep_time = (free_at - current_time) / 1e9 + 1
             
-            # All keys at limit - must wait
-            oldest_time = min(
-                times[0] for times in self.request_times.values() if times
-            )
-            sleep_time = 60 - (current_time - oldest_time) + 1
-            
+            # Sleep without the lock so other threads aren't queued behind it
             print(f"⏳ Rate limit reached. Sleeping {sleep_time:.1f}s...")
             time.sleep(sleep_time)
-            
-            # Retry after sleep
-            return self.wait_if_needed()
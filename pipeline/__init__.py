@@ -1,9 +1,21 @@
 """
 Pipeline package for refactoring workflow
 """
-from .detector import SmellDetector
-from .refactorer import CodeRefactorer
-from .git_handler import GitHubHandler
-from .feedback_loop import FeedbackLoop
+import importlib
+
+# Components are imported on first access (PEP 562) so that importing one
+# stage doesn't pull in the LLM and GitHub SDKs of every other stage
+_LAZY_EXPORTS = {
+    'SmellDetector': '.detector',
+    'CodeRefactorer': '.refactorer',
+    'GitHubHandler': '.git_handler',
+    'FeedbackLoop': '.feedback_loop',
+}
 
 __all__ = ['SmellDetector', 'CodeRefactorer', 'GitHubHandler', 'FeedbackLoop']
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        module = importlib.import_module(_LAZY_EXPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,14 +1,16 @@
-import json
 import os
 from models.gemini_client import GeminiClient
 from models.deepseek_client import DeepSeekClient
+from utils.file_cache import FileCache
+from config import Config
 
 class SmellDetector:
     """
     Orchestrates smell detection using Gemini with DeepSeek fallback
     """
-    def __init__(self):
-        self.gemini = GeminiClient()
+    def __init__(self, gemini=None):
+        # Share one client (connection pools + rate limiter) across stages when given
+        self.gemini = gemini or GeminiClient()
         self.deepseek = None  # Lazy init
     
     def _get_deepseek(self):
@@ -26,45 +28,129 @@ class SmellDetector:
         
         print(f"\n🔍 Analyzing {filename}...")
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            code = f.read()
+        code = FileCache.read_text(filepath)
         
         # Try Gemini first, fall back to DeepSeek
-        result_json = None
+        result = None
+        cached = False
         try:
-            result_json = self.gemini.detect_smells(code, filename)
+            result = self.gemini.detect_smells(code, filename)
+            cached = self.gemini.served_from_cache()
         except Exception as gemini_error:
             error_str = str(gemini_error)
             if '429' in error_str or 'RESOURCE_EXHAUSTED' in error_str:
                 print(f"   ⚠️  Gemini quota exhausted, using DeepSeek fallback...")
                 try:
                     deepseek = self._get_deepseek()
-                    result_json = deepseek.detect_smells(code, filename)
+                    result = deepseek.detect_smells(code, filename)
                 except Exception as ds_error:
                     print(f"   ❌ DeepSeek also failed: {ds_error}")
                     raise
             else:
                 raise
         
-        try:
-            result = json.loads(result_json)
-        except json.JSONDecodeError as e:
-            print(f"   ⚠️  Failed to parse JSON response: {e}")
-            print(f"   Response preview: {result_json[:200]}...")
+        if not isinstance(result, dict):
+            print(f"   ⚠️  Unexpected detection response: {str(result)[:200]}...")
             # Return safe default
             result = {"has_smells": False, "smells": []}
         
-        if result.get('has_smells'):
-            smells = result['smells']
-            print(f"   ⚠️  Found {len(smells)} smell(s):")
-            for smell in smells:
-                print(f"      - {smell.get('type', 'Unknown')} ({smell.get('severity', 'unknown')})")
-        else:
-            print(f"   ✨ No major smells detected")
+        self._print_result(result)
         
         return {
             'filepath': filepath,
             'filename': filename,
             'code': code,
-            'result': result
+            'result': result,
+            'skip_refactor': self._skip_refactor(result),
+            'cached': cached
         }
+    
+    def analyze_batch(self, filepaths, batch_size=8):
+        """
+        Analyze small files several per request
+        
+        Files over DETECT_BATCH_MAX_LINES, duplicate basenames within a batch
+        and files missing from a response are left out of the result; callers
+        run analyze_file for them.
+        Returns: {filepath: detection dict as returned by analyze_file}
+        """
+        detections = {}
+        batch = []
+        batch_tokens = 0
+        
+        for filepath in filepaths:
+            try:
+                code = FileCache.read_text(filepath)
+            except (OSError, UnicodeDecodeError):
+                continue  # Single-file mode reports the error
+            
+            if code.count('\n') > Config.DETECT_BATCH_MAX_LINES:
+                continue
+            
+            tokens = len(code) // 4
+            if tokens > Config.DETECT_BATCH_TOKEN_BUDGET:
+                continue
+            
+            filename = os.path.basename(filepath)
+            if any(os.path.basename(p) == filename for p, _ in batch):
+                continue
+            
+            if batch and (len(batch) >= batch_size or batch_tokens + tokens > Config.DETECT_BATCH_TOKEN_BUDGET):
+                detections.update(self._detect_batch(batch))
+                batch = []
+                batch_tokens = 0
+            
+            batch.append((filepath, code))
+            batch_tokens += tokens
+        
+        if batch:
+            detections.update(self._detect_batch(batch))
+        
+        return detections
+    
+    def _detect_batch(self, batch):
+        """Run one batched request; a failed batch yields no results"""
+        names = [os.path.basename(p) for p, _ in batch]
+        print(f"\n🔍 Analyzing batch of {len(batch)}: {', '.join(names)}")
+        
+        try:
+            results = self.gemini.detect_smells_batch(
+                [(name, code) for name, (_, code) in zip(names, batch)]
+            )
+            cached = self.gemini.served_from_cache()
+        except Exception as e:
+            print(f"   ⚠️  Batch detection failed, falling back to single files: {e}")
+            return {}
+        
+        detections = {}
+        for name, (filepath, code) in zip(names, batch):
+            result = results.get(name)
+            if result is None:
+                continue
+            result.setdefault('smells', [])
+            print(f"   {name}:")
+            self._print_result(result)
+            detections[filepath] = {
+                'filepath': filepath,
+                'filename': name,
+                'code': code,
+                'result': result,
+                'skip_refactor': self._skip_refactor(result),
+                'cached': cached
+            }
+        return detections
+    
+    @staticmethod
+    def _skip_refactor(result):
+        """True when there is nothing for the refactoring model to act on"""
+        return not (result.get('has_smells') and result.get('smells'))
+    
+    def _print_result(self, result):
+        """Print a one-line-per-smell summary of a detection result"""
+        if result.get('has_smells'):
+            smells = result.get('smells', [])
+            print(f"   ⚠️  Found {len(smells)} smell(s):")
+            for smell in smells:
+                print(f"      - {smell.get('type', 'Unknown')} ({smell.get('severity', 'unknown')})")
+        else:
+            print(f"   ✨ No major smells detected")
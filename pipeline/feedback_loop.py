@@ -1,14 +1,19 @@
-import time
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from models.gemini_client import GeminiClient
+from utils.response_parser import ResponseParser
+
+_WORD_RE = re.compile(r'\w+')
 
 class FeedbackLoop:
     """
     Handles PR feedback and iterative improvements
     """
-    def __init__(self, github_handler):
+    def __init__(self, github_handler, gemini=None):
         self.github = github_handler
-        self.gemini = GeminiClient()
+        # Share one client (connection pools + rate limiter) across stages when given
+        self.gemini = gemini or GeminiClient()
     
     def monitor_pr(self, pr_number, max_iterations=3, check_interval=3600):
         """
@@ -40,7 +45,7 @@ class FeedbackLoop:
             feedback = self._extract_feedback(pr)
             
             if not feedback:
-                print(f"   No feedback yet. Sleeping {check_interval}s...")
+                print(f"   No feedback yet. Sleeping {check_interval}s...", flush=True)
                 time.sleep(check_interval)
                 continue
             
@@ -52,7 +57,7 @@ class FeedbackLoop:
             # Update PR
             self._update_pr_branch(pr, revision, iteration + 1)
             
-            print(f"   ✅ Revision {iteration + 1} pushed to PR")
+            print(f"   ✅ Revision {iteration + 1} pushed to PR", flush=True)
         
         print(f"\n⚠️  Reached max iterations ({max_iterations})")
     
@@ -62,6 +67,8 @@ class FeedbackLoop:
         
         # Review comments (line-specific)
         for comment in pr.get_review_comments():
+            if comment.user.login.endswith('[bot]'):
+                continue
             feedback.append({
                 'type': 'line_comment',
                 'file': comment.path,
@@ -72,16 +79,61 @@ class FeedbackLoop:
         
         # General comments
         for comment in pr.get_issue_comments():
+            if comment.user.login.endswith('[bot]'):
+                continue
             feedback.append({
                 'type': 'general_comment',
                 'comment': comment.body,
                 'author': comment.user.login
             })
         
-        return feedback
+        return self._dedupe_comments(feedback)
+    
+    def _dedupe_comments(self, comments, threshold=0.90):
+        """
+        Drop restated feedback before it is sent to the LLM
+        
+        Two comments are duplicates when their word sets overlap by at least
+        threshold (Jaccard) and they point at the same line, or the dropped
+        one is a general comment. Line comments are preferred as the kept
+        representative, then longer ones.
+        """
+        if len(comments) < 4:
+            return comments
+        
+        # Line comments first, longest first - the first of a cluster is kept
+        order = sorted(range(len(comments)), key=lambda i: (
+            comments[i]['type'] != 'line_comment', -len(comments[i]['comment'])
+        ))
+        words = {i: set(_WORD_RE.findall(comments[i]['comment'].lower())) for i in order}
+        
+        kept = []
+        for i in order:
+            location = (comments[i].get('file'), comments[i].get('line'))
+            duplicate = False
+            for j in kept:
+                if comments[i]['type'] == 'line_comment' and location != (comments[j].get('file'), comments[j].get('line')):
+                    continue
+                union = words[i] | words[j]
+                if union and len(words[i] & words[j]) / len(union) >= threshold:
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append(i)
+        
+        if len(kept) < len(comments):
+            print(f"   Dropped {len(comments) - len(kept)} duplicate feedback comment(s)")
+        
+        # Keep the original (chronological) order for the prompt
+        return [comments[i] for i in sorted(kept)]
     
     def _generate_revision(self, pr, feedback):
-        """Ask LLM to address feedback for all files"""
+        """
+        Ask LLM to address feedback for all files
+        
+        Returns: {filename: (revised_code, blob_sha)} - the sha of the
+        fetched version is kept so the update needs no second lookup
+        """
         # Get all files from PR
         files = list(pr.get_files())
         
@@ -98,16 +150,36 @@ class FeedbackLoop:
             for fb in feedback
         ])
         
-        # Process each file
-        for file_obj in files:
-            try:
-                current_code = self.github.repo.get_contents(
-                    file_obj.filename,
-                    ref=pr.head.ref
-                ).decoded_content.decode()
-                
-                # Ask Gemini to revise
-                prompt = f"""
+        # Revise files concurrently - the shared rate limiter spreads the
+        # calls across keys, so up to one request per key is in flight
+        with ThreadPoolExecutor(max_workers=max(1, len(self.gemini.clients))) as executor:
+            futures = {
+                executor.submit(self._revise_one, pr, feedback_text, file_obj): file_obj
+                for file_obj in files
+            }
+            for future in as_completed(futures):
+                file_obj = futures[future]
+                try:
+                    revisions[file_obj.filename] = future.result()
+                except Exception as e:
+                    print(f"   ⚠️  Failed to revise {file_obj.filename}: {e}")
+        
+        return revisions
+    
+    def _revise_one(self, pr, feedback_text, file_obj):
+        """
+        Revise one PR file against the feedback
+        
+        Returns: (revised_code, blob_sha)
+        """
+        contents = self.github.repo.get_contents(
+            file_obj.filename,
+            ref=pr.head.ref
+        )
+        current_code = contents.decoded_content.decode()
+        
+        # Ask Gemini to revise
+        prompt = f"""
 You previously refactored code, but received this feedback from human reviewers:
 
 FEEDBACK:
@@ -123,21 +195,13 @@ Please revise the code to address ALL feedback points.
 - Maintain all previous improvements
 - Return ONLY the complete, updated code without markdown formatting
 """
-                
-                revised = self.gemini.generate(prompt, model_type='pro', temperature=0.3)
-                revisions[file_obj.filename] = self._clean_code(revised)
-                
-            except Exception as e:
-                print(f"   ⚠️  Failed to revise {file_obj.filename}: {e}")
-                continue
         
-        return revisions
+        revised = self.gemini.generate(prompt, model_type='pro', temperature=0.3)
+        return self._clean_code(revised), contents.sha
     
     def _clean_code(self, code):
         """Remove markdown artifacts"""
-        code = re.sub(r'```java\s*', '', code)
-        code = re.sub(r'```\s*', '', code)
-        return code.strip()
+        return ResponseParser.strip_code_fences(code)
     
     def _update_pr_branch(self, pr, revisions, iteration):
         """Update the PR branch with revised code for all files"""
@@ -149,14 +213,13 @@ Please revise the code to address ALL feedback points.
         updated_files = []
         
         # Update each file
-        for filename, new_code in revisions.items():
+        for filename, (new_code, sha) in revisions.items():
             try:
-                contents = self.github.repo.get_contents(filename, ref=branch_name)
                 self.github.repo.update_file(
                     path=filename,
                     message=f"🤖 Revision {iteration}: Address reviewer feedback",
                     content=new_code,
-                    sha=contents.sha,
+                    sha=sha,
                     branch=branch_name
                 )
                 updated_files.append(filename)
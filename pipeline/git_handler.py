@@ -1,9 +1,30 @@
 import os
 import hashlib
-from github import Github
+from github import Github, GithubException, InputGitTreeElement
 from config import Config
 import time
 
+# Per-smell markdown sections, filled with str.format_map
+_SUGGESTIONS_FILE_SMELL = """
+### {type} (Severity: {severity})
+- **Location**: Lines {line_range}
+- **Evidence**: {evidence}
+- **Affected Methods**: {affected_methods}
+"""
+
+_SUGGESTIONS_PR_SMELL = """
+#### {type} ({severity} severity)
+- **Location**: Lines {line_range}
+- **Impact**: Requires multi-file changes
+"""
+
+_PR_SMELL = """
+#### {type} ({severity} severity)
+- **Location:** Lines {line_range}
+- **Evidence:** {evidence}
+- **Affected Methods:** {affected_methods}
+"""
+
 class GitHubHandler:
     """
     Handles all GitHub operations
@@ -20,20 +41,10 @@ class GitHubHandler:
         is_comment_only = refactoring_result.get('is_comment_only', False)
         
         timestamp = int(time.time())
-        file_hash = hashlib.md5(original_filepath.encode()).hexdigest()[:8]
+        file_hash = hashlib.sha1(original_filepath.encode()).hexdigest()[:8]
         branch_name = f"bot/refactor-{timestamp}-{file_hash}"
         smells = refactoring_result['smells']
-        smell_types = [s['type'] for s in smells]
-        
-        # Get base branch
-        base_branch = self.repo.get_branch(self.repo.default_branch)
-        
-        # Create new branch
-        self.repo.create_git_ref(
-            ref=f"refs/heads/{branch_name}",
-            sha=base_branch.commit.sha
-        )
-        print(f"Created branch: {branch_name}")
+        smell_types = ', '.join(s['type'] for s in smells)
         
         if is_comment_only:
             # Create suggestions file instead of refactored code
@@ -41,37 +52,13 @@ class GitHubHandler:
             suggestions_file = file_path.replace('.java', '_REFACTORING_SUGGESTIONS.md')
             
             # Format suggestions as markdown
-            suggestions_content = f"""# Refactoring Suggestions
-
-**File**: `{file_path}`
-
-## Detected Smells
-
-"""
-            for smell in smells:
-                suggestions_content += f"""
-### {smell['type']} (Severity: {smell['severity']})
-- **Location**: Lines {smell.get('line_range', 'N/A')}
-- **Evidence**: {smell['evidence']}
-- **Affected Methods**: {', '.join(smell.get('affected_methods', []))}
-"""
-            
-            suggestions_content += f"""
-
-## Refactoring Guidance
-
-{refactoring_result.get('suggestions', 'See analysis above')}
-
----
-*This refactoring requires changes to multiple files. Please review and apply manually.*
-"""
+            suggestions_content = self._generate_suggestions_file(refactoring_result, file_path)
             
-            # Create suggestions file
-            self.repo.create_file(
-                path=suggestions_file,
-                message=f"Add refactoring suggestions for {os.path.basename(file_path)}",
-                content=suggestions_content,
-                branch=branch_name
+            # Create branch with the suggestions file
+            self._create_branch_with_files(
+                branch_name,
+                {suggestions_file: suggestions_content},
+                f"Add refactoring suggestions for {os.path.basename(file_path)}"
             )
             print(f"Created suggestions file: {suggestions_file}")
             
@@ -83,7 +70,8 @@ class GitHubHandler:
                 base=self.repo.default_branch
             )
         else:
-            # Update files with refactored code (existing logic)
+            # Collect refactored files by repository path
+            files = {}
             for fname, code in refactoring_result['refactored_files'].items():
                 # Determine file path
                 if fname == 'main':
@@ -94,51 +82,117 @@ class GitHubHandler:
                     file_path = os.path.join(dir_path, fname)
                 
                 # Normalize path separators for GitHub
-                file_path = file_path.replace(os.sep, '/')
-                
-                try:
-                    # Try to update existing file
-                    contents = self.repo.get_contents(file_path, ref=branch_name)
-                    self.repo.update_file(
-                        path=file_path,
-                        message=f"Refactor: Fix {', '.join(smell_types)}",
-                        content=code,
-                        sha=contents.sha,
-                        branch=branch_name
-                    )
-                    print(f"Updated: {file_path}")
-                except Exception as e:
-                    # File doesn't exist - create it
-                    if "Not Found" in str(e):
-                        self.repo.create_file(
-                            path=file_path,
-                            message=f"Create helper class {fname}",
-                            content=code,
-                            branch=branch_name
-                        )
-                        print(f"Created: {file_path}")
-                    else:
-                        print(f"Failed to update {file_path}: {e}")
-                        raise
+                files[file_path.replace(os.sep, '/')] = code
+            
+            self._create_branch_with_files(
+                branch_name, files, f"Refactor: Fix {smell_types}"
+            )
+            for file_path in files:
+                print(f"Committed: {file_path}")
             
             # Create PR with refactored code
             pr = self.repo.create_pull(
-                title=f"Automated Refactoring: Fix {', '.join(smell_types)}",
+                title=f"Automated Refactoring: Fix {smell_types}",
                 body=self._generate_pr_body(refactoring_result),
                 head=branch_name,
                 base=self.repo.default_branch
             )
         
-        print(f"PR Created: {pr.html_url}")
+        print(f"PR Created: {pr.html_url}", flush=True)
         return pr
     
+    def _create_branch_with_files(self, branch_name, files, message):
+        """
+        Create a branch whose single commit writes all files
+        
+        Uses the Git Data API (one tree, one commit, one ref) so the number
+        of requests doesn't grow with the number of files. Existing paths
+        are overwritten by the tree, so no per-file sha lookup is needed.
+        """
+        base_branch = self.repo.get_branch(self.repo.default_branch)
+        base_commit = base_branch.commit.commit
+        
+        try:
+            tree = self.repo.create_git_tree(
+                [InputGitTreeElement(path=path, mode='100644', type='blob', content=content)
+                 for path, content in files.items()],
+                base_tree=base_commit.tree
+            )
+            commit = self.repo.create_git_commit(message, tree, [base_commit])
+        except GithubException as e:
+            print(f"Git Data API failed ({e.status}), committing files one by one...")
+            self._create_branch_file_by_file(branch_name, base_branch.commit.sha, files, message)
+            return
+        
+        self.repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=commit.sha)
+        print(f"Created branch: {branch_name}")
+    
+    def _create_branch_file_by_file(self, branch_name, base_sha, files, message):
+        """Fallback: branch from base and write each file through the Contents API"""
+        self.repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=base_sha)
+        print(f"Created branch: {branch_name}")
+        
+        for file_path, content in files.items():
+            try:
+                # Try to update existing file
+                contents = self.repo.get_contents(file_path, ref=branch_name)
+                self.repo.update_file(
+                    path=file_path,
+                    message=message,
+                    content=content,
+                    sha=contents.sha,
+                    branch=branch_name
+                )
+            except GithubException as e:
+                # File doesn't exist - create it
+                if e.status != 404:
+                    print(f"Failed to update {file_path}: {e}")
+                    raise
+                self.repo.create_file(
+                    path=file_path,
+                    message=message,
+                    content=content,
+                    branch=branch_name
+                )
+    
+    @staticmethod
+    def _smell_fields(smell):
+        """Template fields for one smell"""
+        return {
+            'type': smell['type'],
+            'severity': smell['severity'],
+            'line_range': smell.get('line_range', 'N/A'),
+            'evidence': smell.get('evidence', ''),
+            'affected_methods': ', '.join(smell.get('affected_methods', []))
+        }
+    
+    def _generate_suggestions_file(self, refactoring_result, file_path):
+        """Generate the markdown suggestions file for comment-only mode"""
+        parts = [f"""# Refactoring Suggestions
+
+**File**: `{file_path}`
+
+## Detected Smells
+
+"""]
+        parts.extend(_SUGGESTIONS_FILE_SMELL.format_map(self._smell_fields(s)) for s in refactoring_result['smells'])
+        parts.append(f"""
+
+## Refactoring Guidance
+
+{refactoring_result.get('suggestions', 'See analysis above')}
+
+---
+*This refactoring requires changes to multiple files. Please review and apply manually.*
+""")
+        return ''.join(parts)
     
     def _generate_pr_body_for_suggestions(self, refactoring_result, suggestions_file):
         """Generate PR body for comment-only mode"""
         smells = refactoring_result['smells']
-        smell_list = ', '.join([s['type'] for s in smells])
+        smell_list = ', '.join(s['type'] for s in smells)
         
-        body = f"""## Refactoring Suggestions (Multi-File Changes Required)
+        parts = [f"""## Refactoring Suggestions (Multi-File Changes Required)
 
 This code contains design smells that require changes across multiple files. 
 Automated refactoring cannot safely be applied.
@@ -158,42 +212,29 @@ A human developer should:
 
 ### Detected Issues
 
-"""
-        for smell in smells:
-            body += f"""
-#### {smell['type']} ({smell['severity']} severity)
-- **Location**: Lines {smell.get('line_range', 'N/A')}
-- **Impact**: Requires multi-file changes
-"""
-        
-        body += """
+"""]
+        parts.extend(_SUGGESTIONS_PR_SMELL.format_map(self._smell_fields(s)) for s in smells)
+        parts.append("""
 
 ---
 *Generated by the Automated Refactoring Pipeline*
-"""
-        return body
+""")
+        return ''.join(parts)
     
     def _generate_pr_body(self, refactoring_result):
         """Generate detailed PR description"""
         smells = refactoring_result['smells']
         model = refactoring_result['model_used']
         
-        body = f"""## Automated Refactoring
+        parts = [f"""## Automated Refactoring
 
 **Model Used:** {model.upper()}
 
 ### Detected Design Smells
 
-"""
-        for smell in smells:
-            body += f"""
-#### {smell['type']} ({smell['severity']} severity)
-- **Location:** Lines {smell.get('line_range', 'N/A')}
-- **Evidence:** {smell['evidence']}
-- **Affected Methods:** {', '.join(smell.get('affected_methods', []))}
-"""
-        
-        body += """
+"""]
+        parts.extend(_PR_SMELL.format_map(self._smell_fields(s)) for s in smells)
+        parts.append("""
 
 ### Changes Applied
 
@@ -207,5 +248,5 @@ The refactoring preserves all public interfaces while improving internal structu
 
 ---
 *Generated by the Automated Refactoring Pipeline*
-"""
-        return body
+""")
+        return ''.join(parts)
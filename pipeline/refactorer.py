@@ -1,35 +1,66 @@
 import json
 import os
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from models.gemini_client import GeminiClient
 from config import Config
+from utils.file_cache import FileCache
+from utils.file_parser import FileParser
+from utils.response_parser import ResponseParser
+
+# Response headers requested by the refactoring prompt. They lead the reply,
+# so only its first part is searched instead of the whole (possibly long) text
+_SUGGESTIONS_HEADER = "=== REFACTORING SUGGESTIONS ==="
+_CODE_HEADER = "=== REFACTORED CODE ==="
+_HEADER_WINDOW = 1024
+
+def _remove_header(text, header):
+    """Return (found, text without the header) - header searched near the top only"""
+    idx = text.find(header, 0, _HEADER_WINDOW)
+    if idx == -1:
+        return False, text
+    return True, text[:idx] + text[idx + len(header):]
 
 class CodeRefactorer:
     """
     Handles code refactoring using Gemini with smart multi-file detection
     """
-    def __init__(self):
-        self.gemini = GeminiClient()
+    def __init__(self, gemini=None):
+        # Share one client (connection pools + rate limiter) across stages when given
+        self.gemini = gemini or GeminiClient()
+        
+        # {basename: [paths]} for the whole repo, built on first use
+        self._file_index = None
+        self._index_lock = threading.Lock()
+    
+    def _get_index(self):
+        """Index Java files by name with a single repository walk"""
+        with self._index_lock:
+            if self._file_index is None:
+                index = {}
+                # DirEntry already carries the name and joined path
+                for entry in FileParser.walk_java_entries(Config.LOCAL_REPO_PATH, Config.EXCLUDE_DIRS):
+                    index.setdefault(entry.name, []).append(entry.path)
+                self._file_index = index
+            return self._file_index
     
     def get_related_files(self, primary_file, related_filenames):
         """
         Load related files mentioned in smell detection
         """
         context = {}
-        base_path = Config.LOCAL_REPO_PATH
+        index = self._get_index()
         
         for fname in related_filenames[:3]:  # Limit to 3 files
-            # Try to find the file
-            for root, dirs, files in os.walk(base_path):
-                if fname in files:
-                    filepath = os.path.join(root, fname)
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            context[fname] = f.read()
-                        print(f"Loaded related file: {fname}")
-                    except (FileNotFoundError, PermissionError, UnicodeDecodeError) as e:
-                        print(f"Could not load {fname}: {type(e).__name__}")
-                    break
+            # First match in walk order, as the old per-file search returned
+            paths = index.get(fname)
+            if not paths:
+                continue
+            try:
+                context[fname] = FileCache.read_text(paths[0])
+                print(f"Loaded related file: {fname}")
+            except (FileNotFoundError, PermissionError, UnicodeDecodeError) as e:
+                print(f"Could not load {fname}: {type(e).__name__}")
         
         return context
     
@@ -42,7 +73,7 @@ class CodeRefactorer:
         result = detection_result['result']
         filename = detection_result['filename']
         
-        if not result.get('has_smells'):
+        if detection_result.get('skip_refactor') or not result.get('has_smells'):
             return None
         
         smells_json = json.dumps(result['smells'], indent=2)
@@ -51,15 +82,15 @@ class CodeRefactorer:
         related_files = result.get('related_files', [])
         context = self.get_related_files(detection_result['filepath'], related_files)
         
-        print(f"\\nRefactoring {filename}...")
+        print(f"\nRefactoring {filename}...")
         refactored = self.gemini.refactor_code(code, smells_json, context)
         
         # Check if response is suggestions-only or actual refactored code
-        is_suggestions = "=== REFACTORING SUGGESTIONS ===" in refactored
+        is_suggestions, suggestions_text = _remove_header(refactored, _SUGGESTIONS_HEADER)
         
         if is_suggestions:
             # Extract suggestions
-            suggestions = self._extract_suggestions(refactored)
+            suggestions = suggestions_text.strip()
             return {
                 'original': code,
                 'refactored_files': {},
@@ -80,36 +111,76 @@ class CodeRefactorer:
                 'model_used': use_model
             }
     
-    def _extract_suggestions(self, text):
-        """Extract refactoring suggestions from comment-only response"""
-        # Remove the header marker
-        text = text.replace("=== REFACTORING SUGGESTIONS ===", "")
-        return text.strip()
+    def refactor_batch(self, detections, use_model='gemini', max_concurrency=8):
+        """
+        Refactor several detection results with concurrent LLM calls
+        
+        The shared rate limiter still paces the requests; this only keeps
+        several of them in flight instead of waiting on each in turn.
+        Returns: {filepath: refactor() result, or None if it failed}
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(detections)))) as executor:
+            futures = {
+                executor.submit(self.refactor, detection, use_model): detection['filepath']
+                for detection in detections
+            }
+            for future in as_completed(futures):
+                filepath = futures[future]
+                try:
+                    results[filepath] = future.result()
+                except Exception as e:
+                    print(f"Refactoring failed for {os.path.basename(filepath)}: {e}")
+                    results[filepath] = None
+        
+        return results
     
     def _parse_multifile_output(self, refactored_text):
         """
         Parse output that might contain multiple files
         """
         # Remove the refactored code marker if present
-        refactored_text = refactored_text.replace("=== REFACTORED CODE ===", "")
+        _, refactored_text = _remove_header(refactored_text, _CODE_HEADER)
         
         # Check for file markers
         if '===' in refactored_text:
             files = {}
-            parts = re.split(r'===\\s*(\\S+\\.java)\\s*===', refactored_text)
+            markers = self._find_file_markers(refactored_text)
             
-            for i in range(1, len(parts), 2):
-                if i + 1 < len(parts):
-                    fname = parts[i].strip()
-                    code = parts[i + 1].strip()
-                    files[fname] = self._clean_code(code)
+            # Each file's code runs from the end of its marker to the next marker
+            for i, (_, body_start, fname) in enumerate(markers):
+                body_end = markers[i + 1][0] if i + 1 < len(markers) else len(refactored_text)
+                files[fname] = self._clean_code(refactored_text[body_start:body_end].strip())
             
             return files if files else {'main': self._clean_code(refactored_text)}
         
         return {'main': self._clean_code(refactored_text)}
     
+    def _find_file_markers(self, text):
+        """
+        Locate `=== Foo.java ===` headers with a linear str.find scan
+        
+        Returns: [(marker_start, marker_end, filename)] in text order
+        """
+        markers = []
+        pos = 0
+        while True:
+            start = text.find('===', pos)
+            if start == -1:
+                break
+            close = text.find('===', start + 3)
+            if close == -1:
+                break
+            
+            fname = text[start + 3:close].strip()
+            if fname.endswith('.java') and not any(c.isspace() for c in fname):
+                markers.append((start, close + 3, fname))
+                pos = close + 3
+            else:
+                pos = start + 1  # Not a header - keep scanning
+        
+        return markers
+    
     def _clean_code(self, code):
         """Remove markdown artifacts"""
-        code = re.sub(r'```java\\s*', '', code)
-        code = re.sub(r'```\\s*', '', code)
-        return code.strip()
+        return ResponseParser.strip_code_fences(code)
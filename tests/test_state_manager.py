@@ -0,0 +1,122 @@
+import builtins
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.state_manager import StateManager
+
+
+class StateManagerTestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.state_file = os.path.join(self.tmp.name, 'reports', 'pipeline_state.json')
+        self.java_file = os.path.join(self.tmp.name, 'A.java')
+        with open(self.java_file, 'w') as f:
+            f.write('class A {}')
+        quiet = mock.patch.object(builtins, 'print')
+        quiet.start()
+        self.addCleanup(quiet.stop)
+    
+    def _open(self):
+        state = StateManager(self.state_file, flush_interval=60)
+        self.addCleanup(state.close)
+        return state
+    
+    def _complete_one(self):
+        state = self._open()
+        state.start_processing(self.java_file)
+        state.mark_completed(self.java_file)
+        state.close()
+
+
+class StateManagerResetTest(StateManagerTestCase):
+    
+    def test_reopen_after_reset_has_no_previous_run(self):
+        self._complete_one()
+        
+        state = self._open()
+        self.assertTrue(state.has_previous_run())
+        state.reset()
+        state.close()
+        
+        reopened = self._open()
+        self.assertFalse(reopened.has_previous_run())
+        self.assertEqual(reopened.get_summary()['total_discovered'], 0)
+        self.assertEqual(reopened.should_process(self.java_file), (True, 'ready'))
+    
+    def test_corrupt_state_does_not_resurrect_stale_shards(self):
+        self._complete_one()
+        
+        for path in (self.state_file, f"{self.state_file}.backup"):
+            with open(path, 'w') as f:
+                f.write('{not json')
+        
+        reopened = self._open()
+        self.assertFalse(reopened.has_previous_run())
+        reopened.close()
+        
+        # The fresh state's first snapshot must not adopt the old shards either
+        again = self._open()
+        self.assertEqual(again.get_summary()['total_discovered'], 0)
+        self.assertEqual(again.should_process(self.java_file), (True, 'ready'))
+
+
+class StateManagerChangeLogTest(StateManagerTestCase):
+    
+    def test_records_carry_only_changed_counters(self):
+        state = self._open()
+        state.start_processing(self.java_file)
+        state.mark_completed(self.java_file)
+        
+        with open(state.log_file) as f:
+            records = [json.loads(line) for line in f]
+        completed = records[-1]
+        self.assertNotIn('statistics', completed)
+        self.assertNotIn('runs', completed)
+        counters = {tuple(path) for path, _ in completed['stats']}
+        self.assertIn(('completed',), counters)
+        self.assertNotIn(('api_calls', 'gemini_flash'), counters)
+        self.assertEqual(completed['run'][1]['files_processed'], 1)
+    
+    def test_unflushed_changes_are_replayed(self):
+        state = self._open()
+        state.start_processing(self.java_file)
+        state.mark_completed(self.java_file)
+        
+        # Reopen without a snapshot, as after a crash
+        reopened = self._open()
+        summary = reopened.get_summary()
+        self.assertEqual(summary['completed'], 1)
+        self.assertEqual(reopened.state['runs'][-1]['files_processed'], 1)
+        self.assertEqual(reopened.should_process(self.java_file), (False, 'already_completed'))
+
+    
+    def test_failed_log_rotation_keeps_shards_dirty(self):
+        state = self._open()
+        state.start_processing(self.java_file)
+        state.mark_completed(self.java_file)
+        
+        real_replace = os.replace
+        def failing_replace(src, dst):
+            if src == state.log_file:
+                raise OSError(28, 'No space left on device')
+            return real_replace(src, dst)
+        
+        with mock.patch('utils.state_manager.os.replace', side_effect=failing_replace):
+            state.flush()
+        state.flush()
+        state.close()
+        
+        reopened = self._open()
+        self.assertEqual(reopened.should_process(self.java_file), (False, 'already_completed'))
+
+
+if __name__ == '__main__':
+    unittest.main()
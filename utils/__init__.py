@@ -5,5 +5,7 @@ from .file_parser import FileParser
 from .logger import Logger
 from .file_scanner import FileScanner
 from .state_manager import StateManager
+from .response_parser import ResponseParser
+from .file_cache import FileCache
 
-__all__ = ['FileParser', 'Logger', 'FileScanner', 'StateManager']
+__all__ = ['FileParser', 'Logger', 'FileScanner', 'StateManager', 'ResponseParser', 'FileCache']
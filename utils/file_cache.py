@@ -0,0 +1,82 @@
+import os
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+class FileCache:
+    """
+    Memoized file reads keyed on (path, mtime, size)
+    
+    Detection, state tracking and context loading all look at the same
+    files during a run; each version of a file is read and hashed once.
+    Decoded text is shared by content hash, so a file cited as context by
+    many refactorings (or copied under several paths) is decoded once.
+    """
+    
+    _TEXT_CACHE_SIZE = 256
+    
+    # Files at least this large are hashed through a memory map when only
+    # the digest is needed, instead of being copied onto the heap
+    _MMAP_DIGEST_MIN_SIZE = 1 << 20
+    _text_cache = OrderedDict()
+    _text_lock = threading.Lock()
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _load(filepath, mtime_ns, size):
+        """Read and hash one version of a file (the stat fields only key the cache)"""
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        # SHA256 runs on the CPU's SHA extensions via OpenSSL, so it is as
+        # fast as SHA1 and lets state tracking reuse this digest directly
+        return data, hashlib.sha256(data).hexdigest()
+    
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _mapped_digest(filepath, mtime_ns, size):
+        """Hash one version of a large file without reading it into memory"""
+        with open(filepath, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.sha256(mm).hexdigest()
+    
+    @staticmethod
+    def read(filepath):
+        """Return (bytes, sha256_hexdigest) for the current version of a file"""
+        st = os.stat(filepath)
+        return FileCache._load(filepath, st.st_mtime_ns, st.st_size)
+    
+    @staticmethod
+    def read_text(filepath, encoding='utf-8'):
+        """Return the decoded contents of a file"""
+        data, digest = FileCache.read(filepath)
+        key = (digest, encoding)
+        with FileCache._text_lock:
+            text = FileCache._text_cache.get(key)
+            if text is not None:
+                FileCache._text_cache.move_to_end(key)
+                return text
+        
+        text = data.decode(encoding)
+        with FileCache._text_lock:
+            FileCache._text_cache[key] = text
+            if len(FileCache._text_cache) > FileCache._TEXT_CACHE_SIZE:
+                FileCache._text_cache.popitem(last=False)
+        return text
+    
+    @staticmethod
+    def digest(filepath):
+        """Return the sha256 hexdigest of a file's contents"""
+        st = os.stat(filepath)
+        if st.st_size >= FileCache._MMAP_DIGEST_MIN_SIZE:
+            return FileCache._mapped_digest(filepath, st.st_mtime_ns, st.st_size)
+        return FileCache._load(filepath, st.st_mtime_ns, st.st_size)[1]
+    
+    @staticmethod
+    def clear():
+        """Drop all memoized contents"""
+        FileCache._load.cache_clear()
+        FileCache._mapped_digest.cache_clear()
+        with FileCache._text_lock:
+            FileCache._text_cache.clear()
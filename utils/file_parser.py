@@ -1,5 +1,61 @@
 import os
 import re
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+_CLASS_RE = re.compile(r'public\s+class\s+(\w+)')
+_PACKAGE_RE = re.compile(r'package\s+([\w.]+);')
+_IMPORT_RE = re.compile(r'import\s+([\w.]+);')
+# Simple regex for method extraction (not perfect but functional)
+_METHOD_RE = re.compile(r'(public|private|protected)\s+(?:static\s+)?(\w+)\s+(\w+)\s*\([^)]*\)')
+
+# All four of the above as one alternation, for parse_all
+_METADATA_RE = re.compile(
+    r'package\s+(?P<pkg>[\w.]+);'
+    r'|import\s+(?P<imp>[\w.]+);'
+    r'|public\s+class\s+(?P<cls>\w+)'
+    r'|(?P<vis>public|private|protected)\s+(?:static\s+)?(?P<ret>\w+)\s+(?P<mth>\w+)\s*\([^)]*\)'
+)
+
+def _memoize_by_content(copy=None, maxsize=2048):
+    """
+    LRU-cache a code -> result extractor
+    
+    Keyed on (len(code), hash(code)) so cached entries don't keep whole
+    source strings alive (str hashes are cached on the object, so the key
+    is cheap for a string seen before). copy, if given, is applied to
+    results on the way out so callers can't mutate cached lists.
+    """
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+        
+        @wraps(func)
+        def wrapper(code):
+            key = (len(code), hash(code))
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    result = cache[key]
+                    return copy(result) if copy else result
+            
+            result = func(code)
+            with lock:
+                cache[key] = result
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return copy(result) if copy else result
+        
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+def _copy_methods(methods):
+    return [dict(m) for m in methods]
+
+def _copy_metadata(metadata):
+    return dict(metadata, imports=list(metadata['imports']), methods=_copy_methods(metadata['methods']))
 
 class FileParser:
     """
@@ -7,56 +63,156 @@ class FileParser:
     """
     
     @staticmethod
+    @_memoize_by_content()
     def extract_class_name(code):
         """Extract the main class name from Java code"""
-        match = re.search(r'public\s+class\s+(\w+)', code)
+        match = _CLASS_RE.search(code)
         return match.group(1) if match else None
     
     @staticmethod
+    @_memoize_by_content()
     def extract_package_name(code):
         """Extract package declaration from Java code"""
-        match = re.search(r'package\s+([\w.]+);', code)
+        match = _PACKAGE_RE.search(code)
         return match.group(1) if match else None
     
     @staticmethod
+    @_memoize_by_content(copy=list)
     def extract_imports(code):
         """Extract all import statements"""
-        imports = re.findall(r'import\s+([\w.]+);', code)
+        imports = _IMPORT_RE.findall(code)
         return imports
     
     @staticmethod
+    @_memoize_by_content(copy=_copy_methods)
     def extract_methods(code):
         """Extract method signatures"""
-        # Simple regex for method extraction (not perfect but functional)
-        pattern = r'(public|private|protected)\s+(?:static\s+)?(\w+)\s+(\w+)\s*\([^)]*\)'
-        methods = re.findall(pattern, code)
+        methods = _METHOD_RE.findall(code)
         return [{'visibility': m[0], 'return_type': m[1], 'name': m[2]} for m in methods]
     
+    @staticmethod
+    @_memoize_by_content(copy=_copy_metadata)
+    def parse_all(code):
+        """
+        Extract package, imports, class name and methods in one scan
+        
+        Returns: dict with 'package', 'imports', 'class_name', 'methods'
+        shaped like the individual extract_* results
+        """
+        metadata = {'package': None, 'imports': [], 'class_name': None, 'methods': []}
+        
+        for match in _METADATA_RE.finditer(code):
+            kind = match.lastgroup
+            if kind == 'pkg':
+                if metadata['package'] is None:
+                    metadata['package'] = match.group('pkg')
+            elif kind == 'imp':
+                metadata['imports'].append(match.group('imp'))
+            elif kind == 'cls':
+                if metadata['class_name'] is None:
+                    metadata['class_name'] = match.group('cls')
+            else:
+                metadata['methods'].append({
+                    'visibility': match.group('vis'),
+                    'return_type': match.group('ret'),
+                    'name': match.group('mth')
+                })
+        
+        return metadata
+    
     @staticmethod
     def count_lines(code):
-        """Count lines of code (excluding blank lines and comments)"""
-        lines = code.split('\n')
+        """
+        Count lines of code (excluding blank lines and comments)
+        
+        Single pass that jumps between comment delimiters with str.find.
+        A line counts if any non-whitespace text lies outside comments, so
+        `x = 1; /* note */` counts and `/* a */ // b` does not.
+        """
         code_lines = 0
         in_block_comment = False
+        n = len(code)
+        start = 0
         
-        for line in lines:
-            stripped = line.strip()
-            
-            # Handle block comments
-            if '/*' in stripped:
-                in_block_comment = True
-            if '*/' in stripped:
-                in_block_comment = False
-                continue
+        while start <= n:
+            end = code.find('\n', start)
+            if end == -1:
+                end = n
             
-            # Skip blank lines, single-line comments, and block comments
-            if not stripped or stripped.startswith('//') or in_block_comment:
-                continue
+            pos = start
+            has_code = False
+            while pos < end:
+                if in_block_comment:
+                    close = code.find('*/', pos, end)
+                    if close == -1:
+                        break
+                    in_block_comment = False
+                    pos = close + 2
+                    continue
+                
+                slash = code.find('/', pos, end)
+                if slash == -1:
+                    slash = end
+                if not has_code and pos < slash and not code[pos:slash].isspace():
+                    has_code = True
+                if slash == end:
+                    break
+                
+                nxt = code[slash + 1:slash + 2]
+                if nxt == '/':
+                    break  # Rest of the line is a comment
+                if nxt == '*':
+                    in_block_comment = True
+                    pos = slash + 2
+                else:
+                    has_code = True  # Division operator
+                    pos = slash + 1
             
-            code_lines += 1
+            if has_code:
+                code_lines += 1
+            start = end + 1
         
         return code_lines
     
+    @staticmethod
+    def walk_java_files(directory, exclude_dirs=(), exclude_patterns=()):
+        """Yield paths of .java files under directory (see walk_java_entries)"""
+        for entry in FileParser.walk_java_entries(directory, exclude_dirs, exclude_patterns):
+            yield entry.path
+    
+    @staticmethod
+    def walk_java_entries(directory, exclude_dirs=(), exclude_patterns=()):
+        """
+        Yield os.DirEntry objects for .java files, in os.walk (top-down) order
+        
+        Uses os.scandir: file/dir checks come from the directory entry, so
+        there is no extra stat per file. Only regular files are yielded and
+        symlinked directories are not followed (no cycles). Directories
+        named in exclude_dirs, or whose path contains one of
+        exclude_patterns, are not descended into.
+        """
+        # One alternation instead of a substring test per pattern per directory
+        exclude_re = re.compile('|'.join(map(re.escape, exclude_patterns))) if exclude_patterns else None
+        
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            subdirs = []
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in exclude_dirs and not (exclude_re and exclude_re.search(entry.path)):
+                                subdirs.append(entry.path)
+                        elif entry.name.endswith('.java') and entry.is_file(follow_symlinks=False):
+                            # Name test first (free); symlinks, FIFOs and sockets are skipped
+                            yield entry
+            except OSError:
+                continue  # Unreadable directory - skipped, like os.walk
+            
+            # Reversed so subdirectories are visited in listing order
+            stack.extend(reversed(subdirs))
+    
     @staticmethod
     def find_java_files(directory, exclude_patterns=None):
         """
@@ -69,16 +225,4 @@ class FileParser:
         Returns:
             List of absolute file paths
         """
-        exclude_patterns = exclude_patterns or []
-        java_files = []
-        
-        for root, dirs, files in os.walk(directory):
-            # Skip excluded directories
-            if any(pattern in root for pattern in exclude_patterns):
-                continue
-            
-            for file in files:
-                if file.endswith('.java'):
-                    java_files.append(os.path.join(root, file))
-        
-        return java_files
+        return list(FileParser.walk_java_files(directory, exclude_patterns=tuple(exclude_patterns or ())))
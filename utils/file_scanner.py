@@ -1,6 +1,12 @@
 import os
+import itertools
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
+from utils.file_parser import FileParser
+
+# Read size for line counting; files below it take a single read
+_BLOCK_SIZE = 1 << 20
 
 class FileScanner:
     """
@@ -33,9 +39,11 @@ class FileScanner:
         else:
             raise ValueError(f"Unknown scan mode: {self.mode}")
         
-        # Apply max files limit
+        # Apply max files limit - modes may return generators, so only
+        # one file past the limit is ever pulled from the walk
+        files = list(itertools.islice(files, Config.MAX_FILES_PER_RUN + 1))
         if len(files) > Config.MAX_FILES_PER_RUN:
-            print(f"⚠️  Found {len(files)} files, limiting to {Config.MAX_FILES_PER_RUN}")
+            print(f"⚠️  Found more than {Config.MAX_FILES_PER_RUN} files, limiting to {Config.MAX_FILES_PER_RUN}")
             files = files[:Config.MAX_FILES_PER_RUN]
         
         print(f"✅ Selected {len(files)} files for analysis")
@@ -52,21 +60,23 @@ class FileScanner:
         print(f"   Scanning files changed in last {hours} hours...")
         
         try:
-            os.chdir(self.repo_path)
-            
-            # Get changed files from git
+            # Get changed files from git - the pathspec and filter let git drop
+            # non-Java and deleted files; -z output needs no quoting/escape handling
             result = subprocess.run(
-                ['git', 'diff', '--name-only', f'HEAD@{{{hours} hours ago}}..HEAD'],
+                ['git', 'diff', '--name-only', '-z', '--diff-filter=d',
+                 f'HEAD@{{{hours} hours ago}}..HEAD', '--', '*.java'],
+                cwd=self.repo_path,  # No process-wide os.chdir
                 capture_output=True,
                 text=True,
-                check=True
+                check=True,
+                timeout=30
             )
             
-            changed_files = result.stdout.strip().split('\n')
+            changed_files = [f for f in result.stdout.split('\0') if f]
             java_files = [
                 os.path.join(self.repo_path, f) 
                 for f in changed_files 
-                if f.endswith('.java') and os.path.exists(os.path.join(self.repo_path, f))
+                if os.path.exists(os.path.join(self.repo_path, f))
             ]
             
             if not java_files:
@@ -84,18 +94,35 @@ class FileScanner:
         min_lines = Config.SCAN_MIN_LINES
         print(f"   Scanning files with ≥{min_lines} lines...")
         
-        all_files = self._get_all_java_files()
+        # Byte size is a cheap proxy for line count: a file can't have more
+        # lines than bytes, so smaller files are dropped without opening them,
+        # and the rest are counted largest first
+        candidates = []
+        for entry in FileParser.walk_java_entries(self.repo_path, Config.EXCLUDE_DIRS):
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            if size >= min_lines:
+                candidates.append((size, entry.path))
+        candidates.sort(reverse=True)
+        
+        # Only the top of the size ranking can make the per-run cut; count in
+        # rounds until enough qualifying files are found
+        wanted = Config.MAX_FILES_PER_RUN
+        round_size = max(32, wanted * 4)
         large_files = []
         
-        for filepath in all_files:
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    line_count = sum(1 for _ in f)
-                
-                if line_count >= min_lines:
-                    large_files.append((filepath, line_count))
-            except:
-                pass
+        # Counting is I/O-bound; overlap the reads across files
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            for i in range(0, len(candidates), round_size):
+                paths = [path for _, path in candidates[i:i + round_size]]
+                large_files.extend(
+                    (filepath, line_count) for filepath, line_count in executor.map(self._count_lines, paths)
+                    if line_count is not None and line_count >= min_lines
+                )
+                if len(large_files) >= wanted:
+                    break
         
         # Sort by size (largest first - most likely to have God Class)
         large_files.sort(key=lambda x: x[1], reverse=True)
@@ -105,15 +132,37 @@ class FileScanner:
         
         return [f[0] for f in large_files]
     
+    @staticmethod
+    def _count_lines(filepath):
+        """
+        Count newlines in the raw bytes (bytes.count runs in C)
+        
+        Files up to 1 MiB - nearly every source file - are read with a
+        single call; larger ones in 1 MiB blocks to bound memory.
+        Returns: (filepath, line_count), line_count is None if unreadable
+        """
+        try:
+            with open(filepath, 'rb') as f:
+                data = f.read(_BLOCK_SIZE)
+                line_count = data.count(b'\n')
+                last = data[-1:] or b'\n'  # Empty file: no lines
+                if len(data) == _BLOCK_SIZE:
+                    for block in iter(lambda: f.read(_BLOCK_SIZE), b''):
+                        line_count += block.count(b'\n')
+                        last = block[-1:]
+            # A final line without a trailing newline still counts
+            if last != b'\n':
+                line_count += 1
+            return filepath, line_count
+        except OSError:
+            return filepath, None
+    
     def _scan_package(self):
         """Scan specific package"""
         package = Config.SCAN_PACKAGE
         print(f"   Scanning package: {package}")
         
-        all_files = self._get_all_java_files()
-        package_files = [f for f in all_files if package in f]
-        
-        return package_files
+        return (f for f in self._get_all_java_files() if package in f)
     
     def _scan_manual(self):
         """Use manually specified files"""
@@ -121,10 +170,7 @@ class FileScanner:
         
         files = []
         for rel_path in Config.MANUAL_FILES:
-            if not rel_path.strip():
-                continue
-            
-            full_path = os.path.join(self.repo_path, rel_path.strip())
+            full_path = os.path.join(self.repo_path, rel_path)
             if os.path.exists(full_path):
                 files.append(full_path)
                 print(f"      ✓ {rel_path}")
@@ -135,17 +181,6 @@ class FileScanner:
     
     def _get_all_java_files(self):
         """
-        Recursively find all .java files
+        Recursively find all .java files (lazily, in walk order)
         """
-        java_files = []
-        
-        for root, dirs, files in os.walk(self.repo_path):
-            # Exclude certain directories
-            dirs[:] = [d for d in dirs if d not in Config.EXCLUDE_DIRS]
-            
-            for file in files:
-                if file.endswith('.java'):
-                    full_path = os.path.join(root, file)
-                    java_files.append(full_path)
-        
-        return java_files
+        return FileParser.walk_java_files(self.repo_path, Config.EXCLUDE_DIRS)
@@ -1,4 +1,5 @@
 import logging
+import logging.handlers
 import os
 from datetime import datetime
 
@@ -7,6 +8,9 @@ class Logger:
     Logging utility for the refactoring pipeline
     """
     
+    # (date stamp, path) of the default daily log file, computed once per day
+    _default_log_file = None
+    
     @staticmethod
     def setup(name='refactoring_pipeline', log_file=None, level=logging.INFO):
         """
@@ -40,35 +44,52 @@ class Logger:
         
         # File handler
         if log_file is None:
-            os.makedirs('logs', exist_ok=True)
-            log_file = f"logs/pipeline_{datetime.now().strftime('%Y%m%d')}.log"
+            log_file = Logger._get_default_log_file()
         
         file_handler = logging.FileHandler(log_file)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        
+        # Buffer file writes: flushed every 1024 records, on WARNING and
+        # above, and at interpreter shutdown
+        buffered_handler = logging.handlers.MemoryHandler(
+            capacity=1024,
+            flushLevel=logging.WARNING,
+            target=file_handler
+        )
+        logger.addHandler(buffered_handler)
         
         return logger
     
+    @staticmethod
+    def _get_default_log_file():
+        """Path of today's log file, creating logs/ on first use"""
+        stamp = datetime.now().strftime('%Y%m%d')
+        if Logger._default_log_file is None or Logger._default_log_file[0] != stamp:
+            os.makedirs('logs', exist_ok=True)
+            Logger._default_log_file = (stamp, f"logs/pipeline_{stamp}.log")
+        return Logger._default_log_file[1]
+    
     @staticmethod
     def log_smell_detection(logger, filename, smells):
         """Log smell detection results"""
-        logger.info(f"Analyzed {filename}")
+        # %-style args: the message is only built if the record is emitted
+        logger.info("Analyzed %s", filename)
         if smells:
-            logger.warning(f"Found {len(smells)} smell(s) in {filename}")
+            logger.warning("Found %d smell(s) in %s", len(smells), filename)
             for smell in smells:
-                logger.warning(f"  - {smell['type']}: {smell['evidence']}")
+                logger.warning("  - %s: %s", smell['type'], smell['evidence'])
         else:
-            logger.info(f"No smells detected in {filename}")
+            logger.info("No smells detected in %s", filename)
     
     @staticmethod
     def log_refactoring(logger, filename, model, success=True):
         """Log refactoring results"""
         if success:
-            logger.info(f"Successfully refactored {filename} using {model}")
+            logger.info("Successfully refactored %s using %s", filename, model)
         else:
-            logger.error(f"Failed to refactor {filename} using {model}")
+            logger.error("Failed to refactor %s using %s", filename, model)
     
     @staticmethod
     def log_pr_creation(logger, pr_url):
         """Log PR creation"""
-        logger.info(f"Created PR: {pr_url}")
+        logger.info("Created PR: %s", pr_url)
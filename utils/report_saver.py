@@ -5,36 +5,46 @@ Enhanced save_report with comment-only mode support
 import json
 import os
 
+# Output directories already created in this run
+_created_dirs = set()
+
+def _write_text(path, text):
+    """Write text as UTF-8 in one buffered binary write (no newline translation)"""
+    with open(path, 'wb', buffering=1 << 20) as f:
+        f.write(text.encode('utf-8'))
+
 def save_report_enhanced(detection, refactoring, output_dir):
     """Save refactoring report with support for comment-only mode"""
-    os.makedirs(output_dir, exist_ok=True)
+    if output_dir not in _created_dirs:
+        os.makedirs(output_dir, exist_ok=True)
+        _created_dirs.add(output_dir)
     
     filename = detection['filename'].replace('.java', '')
     
     # Save original
-    with open(f"{output_dir}/{filename}_original.java", 'w') as f:
-        f.write(detection['code'])
+    _write_text(f"{output_dir}/{filename}_original.java", detection['code'])
     
     # Check if comment-only mode
     is_comment_only = refactoring.get('is_comment_only', False)
     
     if is_comment_only:
         # Save suggestions file instead of refactored code
-        with open(f"{output_dir}/{filename}_refactoring_suggestions.md", 'w') as f:
-            f.write(f"# Refactoring Suggestions for {detection['filename']}\\n\\n")
-            f.write("**This file requires multi-file changes. Manual refactoring is recommended.**\\n\\n")
-            f.write("## Detected Smells\\n\\n")
-            for smell in refactoring.get('smells', []):
-                f.write(f"- **{smell['type']}** (Severity: {smell['severity']})\\n")
-            f.write("\\n## Refactoring Guidance\\n\\n")
-            f.write(refactoring.get('suggestions', 'No suggestions provided'))
+        parts = [
+            f"# Refactoring Suggestions for {detection['filename']}\n\n",
+            "**This file requires multi-file changes. Manual refactoring is recommended.**\n\n",
+            "## Detected Smells\n\n"
+        ]
+        for smell in refactoring.get('smells', []):
+            parts.append(f"- **{smell['type']}** (Severity: {smell['severity']})\n")
+        parts.append("\n## Refactoring Guidance\n\n")
+        parts.append(refactoring.get('suggestions', 'No suggestions provided'))
+        _write_text(f"{output_dir}/{filename}_refactoring_suggestions.md", ''.join(parts))
         print(f"Multi-file refactoring detected - saved suggestions to {output_dir}/{filename}_refactoring_suggestions.md")
     else:
         # Save refactored code
         for fname, code in refactoring.get('refactored_files', {}).items():
             output_name = f"{filename}_refactored.java" if fname == 'main' else fname
-            with open(f"{output_dir}/{output_name}", 'w') as f:
-                f.write(code)
+            _write_text(f"{output_dir}/{output_name}", code)
         print(f"Refactored code saved to {output_dir}/")
     
     # Save metadata
@@ -48,7 +58,6 @@ def save_report_enhanced(detection, refactoring, output_dir):
         'has_suggestions': is_comment_only
     }
     
-    with open(f"{output_dir}/{filename}_metadata.json", 'w') as f:
-        json.dump(metadata, f, indent=2)
+    _write_text(f"{output_dir}/{filename}_metadata.json", json.dumps(metadata, indent=2))
     
     return is_comment_only
@@ -0,0 +1,94 @@
+import json
+import re
+
+# Characters that matter when matching braces: quotes, escapes, braces
+_JSON_TOKEN_RE = re.compile(r'[{}"\\]')
+
+class ResponseParser:
+    """
+    Single-pass helpers for pulling code and JSON out of LLM responses
+    
+    Plain str.find scans instead of .*-style regexes, which backtrack
+    badly on long responses.
+    """
+    
+    @staticmethod
+    def find_json_object(text):
+        """
+        Return the first top-level JSON object embedded in text, or None
+        
+        One pass over the quote, backslash and brace characters from the
+        first '{' finds where that object closes (braces inside strings
+        are skipped), and only that slice is parsed. A truncated or
+        invalid object gives None, never an object nested inside it.
+        """
+        start = text.find('{')
+        if start == -1:
+            return None
+        
+        depth = 0
+        in_string = False
+        skip = -1
+        for match in _JSON_TOKEN_RE.finditer(text, start):
+            pos = match.start()
+            if pos < skip:
+                continue  # Escaped character
+            char = match.group()
+            if in_string:
+                if char == '\\':
+                    skip = pos + 2
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    try:
+                        obj = json.loads(text[start:pos + 1])
+                    except json.JSONDecodeError:
+                        return None
+                    return obj if isinstance(obj, dict) else None
+        
+        return None  # Never closed: truncated reply
+    
+    @staticmethod
+    def extract_fenced_block(text, language='json'):
+        """Return the stripped body of the first ``` block (optionally ```<language>), or None"""
+        start = text.find('```')
+        if start == -1:
+            return None
+        start += 3
+        if text.startswith(language, start):
+            start += len(language)
+        
+        end = text.find('```', start)
+        if end == -1:
+            return None
+        return text[start:end].strip()
+    
+    @staticmethod
+    def strip_code_fences(code, language='java'):
+        """Remove every ``` / ```<language> fence and the whitespace after it"""
+        idx = code.find('```')
+        if idx == -1:
+            return code.strip()  # No fences: nothing to rebuild
+        
+        parts = []
+        pos = 0
+        while True:
+            idx = code.find('```', pos)
+            if idx == -1:
+                parts.append(code[pos:])
+                break
+            
+            parts.append(code[pos:idx])
+            pos = idx + 3
+            if code.startswith(language, pos):
+                pos += len(language)
+            while pos < len(code) and code[pos].isspace():
+                pos += 1
+        
+        return ''.join(parts).strip()
@@ -8,52 +8,154 @@ Handles:
 - Retry logic with configurable max attempts
 - Statistics and cost tracking
 - Atomic saves to prevent corruption
-- File hash tracking to detect changes
+- Per-file entries sharded across files; only changed shards are rewritten
+- Append-only change log between snapshots (replayed on load)
+- Coalesced saves (at most one write per flush interval, flushed in the background)
+- File hash tracking to detect changes (cached on mtime + size)
 """
 
 import json
 import os
-import hashlib
+import atexit
 import time
+import shutil
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
-from threading import RLock
+from threading import Event, Lock, RLock, Thread
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
+from utils.file_cache import FileCache
+
+# Compact separators keep encoding on json's C accelerator (indent= forces
+# the pure-Python encoder, ~5x slower on large states)
+_json_dumps = json.JSONEncoder(separators=(',', ':')).encode
+_json_loads = json.loads
+
+# Display names for progress lines; the same paths recur on every mutation
+_basename = lru_cache(maxsize=8192)(os.path.basename)
+
+def _flatten(tree: Dict, prefix: Tuple[str, ...] = ()) -> Dict[Tuple[str, ...], object]:
+    """Leaf values of nested dicts keyed by their key path"""
+    leaves = {}
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            leaves.update(_flatten(value, prefix + (key,)))
+        else:
+            # Copy lists: counters in them are incremented in place
+            leaves[prefix + (key,)] = value[:] if isinstance(value, list) else value
+    return leaves
+
+def _format_ts(ts) -> str:
+    """
+    Readable form of a stored per-file timestamp, for summary output
+    
+    Entries store int nanoseconds (time.time_ns()); states written before
+    that hold ISO strings, which are returned as they are.
+    """
+    if ts is None:
+        return 'Unknown'
+    if isinstance(ts, str):
+        return ts
+    return datetime.fromtimestamp(ts / 1e9).isoformat()
+
+# Index of each severity in a smell type's fixed-shape 'sev' counters;
+# anything else is counted as medium, the default
+_SEVERITY_IDX = {'low': 0, 'medium': 1, 'high': 2}
 
 class StateManager:
     """
     Thread-safe state manager for pipeline progress tracking
     """
     
-    def __init__(self, state_file='refactoring_reports/pipeline_state.json', max_retries=3):
+    def __init__(self, state_file='refactoring_reports/pipeline_state.json', max_retries=3, flush_interval=5.0):
         self.state_file = state_file
         self.max_retries = max_retries
+        
+        # Mutations mark the state dirty; the flusher thread writes it at
+        # most once per interval
+        self.flush_interval = max(flush_interval, 0.1)
+        self._dirty = False
+        
         # Use RLock (re-entrant lock) instead of Lock to allow nested locking
         # This fixes deadlock when methods that hold the lock call _save_state()
         self.lock = RLock()
         
+        # Serializes snapshot writes; held without self.lock during disk I/O
+        self._io_lock = Lock()
+        
         # Ensure directory exists
-        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+        self._state_dir = os.path.dirname(state_file) or '.'
+        os.makedirs(self._state_dir, exist_ok=True)
+        
+        # Per-mutation deltas are appended here between full snapshots
+        self.log_file = f"{state_file}.log"
+        self._rotated_log_file = f"{self.log_file}.1"
         
-        # Load or initialize state
+        # File entries and hash cache are split across shard files so a
+        # snapshot only rewrites the shards touched since the previous one
+        self.shard_dir = f"{state_file}.shards"
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self._shard_paths = {}
+        self._dirty_shards = set()
+        
+        # Shards on disk are only read once one of their paths is accessed
+        self._unloaded_shards = set()
+        
+        # Digests of what is on disk, so unchanged payloads are not rewritten
+        self._master_digest = None
+        self._shard_digests = {}
+        
+        # Load or initialize state, then re-apply changes logged since the snapshot
         self.state = self._load_state()
+        self._log_fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        replayed = self._replay_log()
+        self._mark_logged()
+        
+        # Inline (pre-shard) state: every path goes to a shard on the next
+        # snapshot. Sharded state: only the replayed entries' shards are
+        # read now (merged under the replayed entries) and rewritten.
+        for filepath in set(self.state['files']) | set(self.state.setdefault('hash_cache', {})):
+            self._touch(filepath)
+        if not self._loaded_sharded:
+            self._dirty = True
+        if replayed:
+            # Fold replayed records into a snapshot before the log rotates again
+            self.flush()
+        
+        # Files that can still be retried, and permanently failed files.
+        # Both need every shard, so they are computed on first use and then
+        # kept up to date on each status change.
+        self._pending_count = None
+        self._failed_files = None
         
         # Track current run
         self._current_run_id = self._init_current_run()
+        
+        # Background flusher writes out the trailing coalesced update even
+        # when no further mutation arrives to trigger it
+        self._stop_flusher = Event()
+        Thread(target=self._flush_periodically, name='state-flusher', daemon=True).start()
+        
+        # Don't lose coalesced updates on normal interpreter exit
+        atexit.register(self.close)
     
     def _load_state(self) -> Dict:
         """Load state from disk, with backup recovery"""
+        self._loaded_sharded = False
         if os.path.exists(self.state_file):
             try:
                 with open(self.state_file, 'r') as f:
-                    state = json.load(f)
+                    state = _json_loads(f.read())
                 
                 # Validate structure
-                if 'version' in state and 'files' in state:
-                    return state
+                if 'version' in state and ('files' in state or state.get('sharded')):
+                    return self._load_shards(state)
                 else:
                     print("WARNING: State file has old format, resetting...")
-                    return self._create_new_state()
+                    return self._fresh_state()
             
             except json.JSONDecodeError as e:
                 print(f"WARNING: Corrupted state file: {e}")
@@ -64,16 +166,135 @@ class StateManager:
                     print("   Attempting restore from backup...")
                     try:
                         with open(backup, 'r') as f:
-                            return json.load(f)
+                            return self._load_shards(_json_loads(f.read()))
                     except:
                         pass
                 
                 # Reset if backup fails
                 print("   Creating new state...")
-                return self._create_new_state()
+                return self._fresh_state()
         
+        return self._fresh_state()
+    
+    def _fresh_state(self) -> Dict:
+        """New empty state; shards left by an unusable state must not be hydrated into it"""
+        self._remove_shard_files()
         return self._create_new_state()
     
+    def _remove_shard_files(self):
+        """Delete every shard file on disk and forget what was written"""
+        for name in os.listdir(self.shard_dir):
+            try:
+                os.remove(os.path.join(self.shard_dir, name))
+            except OSError:
+                pass
+        self._shard_paths = {}
+        self._dirty_shards = set()
+        self._unloaded_shards = set()
+        self._shard_digests = {}
+    
+    @staticmethod
+    def _shard_of(filepath: str) -> str:
+        """Shard id (one of 256) for a file path"""
+        return hashlib.blake2b(filepath.encode('utf-8'), digest_size=1).hexdigest()
+    
+    def _load_shards(self, state: Dict) -> Dict:
+        """Register the shards of a loaded master state (their entries load lazily)"""
+        self._loaded_sharded = state.pop('sharded', False)
+        if not self._loaded_sharded:
+            return state
+        
+        state['files'] = {}
+        state['hash_cache'] = {}
+        self._unloaded_shards = {
+            name[:-len('.json')] for name in os.listdir(self.shard_dir) if name.endswith('.json')
+        }
+        return state
+    
+    def _hydrate(self, shard_id: str):
+        """Merge one shard from disk into the in-memory state (caller holds self.lock)"""
+        self._unloaded_shards.discard(shard_id)
+        name = f"{shard_id}.json"
+        try:
+            with open(os.path.join(self.shard_dir, name), 'r') as f:
+                shard = _json_loads(f.read())
+        except (OSError, json.JSONDecodeError) as e:
+            # The change log or a later run re-creates lost entries
+            print(f"WARNING: Skipping unreadable state shard {name}: {e}")
+            return
+        
+        # Entries already in memory (replayed from the log) are newer
+        paths = self._shard_paths.setdefault(shard_id, set())
+        for key in ('files', 'hash_cache'):
+            target = self.state[key]
+            for filepath, entry in shard.get(key, {}).items():
+                target.setdefault(filepath, entry)
+                paths.add(filepath)
+    
+    def _hydrate_path(self, filepath: str):
+        """Make sure the shard holding a path has been read"""
+        if self._unloaded_shards:
+            shard_id = self._shard_of(filepath)
+            if shard_id in self._unloaded_shards:
+                with self.lock:
+                    if shard_id in self._unloaded_shards:
+                        self._hydrate(shard_id)
+    
+    def _hydrate_all(self):
+        """Read every shard not loaded yet (for whole-state queries)"""
+        with self.lock:
+            for shard_id in list(self._unloaded_shards):
+                self._hydrate(shard_id)
+    
+    def _touch(self, filepath: str):
+        """Record that a path's entry changed, so its shard is rewritten"""
+        self._hydrate_path(filepath)
+        shard_id = self._shard_of(filepath)
+        self._shard_paths.setdefault(shard_id, set()).add(filepath)
+        self._dirty_shards.add(shard_id)
+    
+    def _replay_log(self) -> int:
+        """Apply change-log records written after the last snapshot"""
+        replayed = 0
+        
+        # A log rotated out by an interrupted snapshot write comes first
+        for log_file in (self._rotated_log_file, self.log_file):
+            if not os.path.exists(log_file):
+                continue
+            
+            with open(log_file, 'r') as f:
+                for line in f:
+                    try:
+                        record = _json_loads(line)
+                    except json.JSONDecodeError:
+                        # Torn final write from a crash; everything before it is intact
+                        break
+                    
+                    if 'file' in record:
+                        self.state['files'][record['file']] = record['file_state']
+                    if 'statistics' in record:
+                        # Full-state record from an older version
+                        self.state['statistics'] = record['statistics']
+                        self.state['runs'] = record['runs']
+                    for path, value in record.get('stats', ()):
+                        target = self.state['statistics']
+                        for key in path[:-1]:
+                            target = target.setdefault(key, {})
+                        target[path[-1]] = value
+                    if 'run' in record:
+                        index, run = record['run']
+                        runs = self.state['runs']
+                        if index < len(runs):
+                            runs[index] = run
+                        else:
+                            runs.append(run)
+                    replayed += 1
+        
+        if replayed:
+            print(f"Replayed {replayed} logged state change(s)")
+            self._dirty = True
+        return replayed
+    
     def _create_new_state(self) -> Dict:
         """Create fresh state structure with enhanced metrics"""
         return {
@@ -82,6 +303,7 @@ class StateManager:
             'last_updated': datetime.now().isoformat(),
             'runs': [],
             'files': {},
+            'hash_cache': {},  # path -> [mtime_ns, size, file_hash]
             'statistics': {
                 'total_files_processed': 0,
                 'completed': 0,
@@ -101,7 +323,12 @@ class StateManager:
         }
     
     def _init_current_run(self) -> int:
-        """Initialize or resume current run"""
+        """
+        Initialize or resume current run
+        
+        Called from __init__ before the flusher thread starts and without
+        self.lock held, so its forced save follows the flush() lock order.
+        """
         runs = self.state.get('runs', [])
         
         # Check if there's an incomplete run
@@ -120,47 +347,310 @@ class StateManager:
                 'prs_created': 0
             })
             self.state['runs'] = runs
-            self._save_state()
+            self._save_state(force=True)
             print(f"Starting run #{run_id}")
             return run_id
     
-    def _save_state(self):
-        """Atomically save state to disk"""
+    def _save_state(self, force=False):
+        """
+        Mark state dirty; forced saves also write it to disk immediately
+        
+        Unforced saves are picked up by the flusher thread, so the state is
+        written at most once per flush_interval. Forced saves are milestones
+        and are written durably; they must not be made while holding
+        self.lock (see flush()).
+        """
         with self.lock:
+            self._dirty = True
+        
+        if force:
+            self.flush(durable=True)
+    
+    def _take_snapshot(self) -> Optional[Tuple[Optional[str], Dict[str, str]]]:
+        """
+        Serialize dirty state and rotate the change log (caller holds _io_lock)
+        
+        Returns the master payload (everything but per-file data, or None
+        when identical to what is on disk) and the payloads of the shards
+        whose contents changed since the last snapshot. Only this
+        step runs under self.lock; the disk writes happen after it is
+        released so other threads are not stalled on file I/O.
+        """
+        with self.lock:
+            if not self._dirty:
+                return None
+            
+            # The master is compared without its timestamp; last_updated
+            # only moves when something else in it changed
+            master = {k: v for k, v in self.state.items() if k not in ('files', 'hash_cache', 'last_updated')}
+            master['sharded'] = True
+            payload = _json_dumps(master)
+            digest = hashlib.sha1(payload.encode('utf-8')).digest()
+            if digest == self._master_digest:
+                payload = None
+            else:
+                self._master_digest = digest
+                self.state['last_updated'] = master['last_updated'] = datetime.now().isoformat()
+                payload = _json_dumps(master)
+            
+            files = self.state['files']
+            hash_cache = self.state['hash_cache']
+            shard_payloads = {}
+            for shard_id in self._dirty_shards:
+                paths = self._shard_paths.get(shard_id, ())
+                shard_payload = _json_dumps({
+                    'files': {p: files[p] for p in paths if p in files},
+                    'hash_cache': {p: hash_cache[p] for p in paths if p in hash_cache}
+                })
+                digest = hashlib.sha1(shard_payload.encode('utf-8')).digest()
+                if digest != self._shard_digests.get(shard_id):
+                    self._shard_digests[shard_id] = digest
+                    shard_payloads[shard_id] = shard_payload
+            
+            # Records logged from here on are not in this payload; they go
+            # to a fresh log while the old one is kept until the write lands
+            if os.path.exists(self._rotated_log_file):
+                # The previous snapshot never landed and records are deltas,
+                # so its log is still needed: append this one to it
+                with open(self.log_file, 'rb') as src, open(self._rotated_log_file, 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.ftruncate(self._log_fd, 0)
+            else:
+                # Rename first: if it fails, the current fd is still usable
+                os.replace(self.log_file, self._rotated_log_file)
+                os.close(self._log_fd)
+                self._log_fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            
+            # Only once the log has rotated: if that fails, these shards
+            # must still be written before their records are dropped
+            self._dirty_shards = set()
+            self._dirty = False
+            return payload, shard_payloads
+    
+    def _write_snapshot(self, payload: Optional[str], shard_payloads: Dict[str, str], durable: bool = False):
+        """
+        Atomically write a serialized snapshot (caller holds _io_lock)
+        
+        Routine snapshots skip fsync: the rename still keeps the file whole
+        after a process crash, and the change log covers anything newer.
+        Durable snapshots also fsync the data and the directory entry so
+        they survive power loss.
+        """
+        # Shards first: the master is only replaced once they have all landed
+        for shard_id, shard_payload in shard_payloads.items():
+            shard_file = os.path.join(self.shard_dir, f"{shard_id}.json")
+            with open(f"{shard_file}.tmp", 'w') as f:
+                f.write(shard_payload)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(f"{shard_file}.tmp", shard_file)
+        
+        if durable and shard_payloads:
+            self._fsync_dir(self.shard_dir)
+        
+        if payload is not None:
+            self._write_master(payload, durable)
+        
+        # Snapshot now covers every record in the rotated log (replaying a
+        # record twice is harmless, so a crash before this point is safe)
+        os.remove(self._rotated_log_file)
+    
+    def _write_master(self, payload: str, durable: bool):
+        """Replace the master state file, keeping the previous one as backup"""
+        # Atomic write: temp file → rename
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            f.write(payload)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        
+        # Backup existing state via a hard link, so the state file itself is
+        # never missing; the rename below then swaps it atomically
+        if os.path.exists(self.state_file):
+            backup = f"{self.state_file}.backup"
             try:
-                # Update timestamp
-                self.state['last_updated'] = datetime.now().isoformat()
-                
-                # Atomic write: temp file → rename
-                temp_file = f"{self.state_file}.tmp"
-                with open(temp_file, 'w') as f:
-                    json.dump(self.state, f, indent=2)
-                
-                # Backup existing state
-                if os.path.exists(self.state_file):
-                    backup = f"{self.state_file}.backup"
-                    os.replace(self.state_file, backup)
-                
-                # Rename temp to actual
-                os.replace(temp_file, self.state_file)
+                backup_tmp = f"{backup}.tmp"
+                if os.path.exists(backup_tmp):
+                    os.remove(backup_tmp)
+                os.link(self.state_file, backup_tmp)
+                os.replace(backup_tmp, backup)
+            except OSError:
+                # Filesystem without hard links: fall back to a copy
+                shutil.copyfile(self.state_file, backup)
+        
+        # Rename temp to actual
+        os.replace(temp_file, self.state_file)
+        if durable:
+            self._fsync_dir(self._state_dir)
+    
+    @staticmethod
+    def _fsync_dir(path: str):
+        """Flush a directory's entries (renames) to disk"""
+        dir_fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
+    def _record_change(self, filepath: Optional[str] = None):
+        """
+        Append one mutation to the change log and mark the state dirty
+        
+        Records carry the whole changed file entry, the statistics counters
+        that changed since the previous record and the current run if it
+        changed, so a record stays O(delta). Values are absolute, so replay
+        over the snapshot just overwrites. The append is left to the OS page
+        cache; a crash can lose at most the last few records, as coalesced
+        snapshots could before.
+        """
+        with self.lock:
+            record = {}
+            stats = _flatten(self.state['statistics'])
+            changed = [[list(path), value] for path, value in stats.items() if self._logged_stats.get(path) != value]
+            if changed:
+                record['stats'] = changed
+            self._logged_stats = stats
+            
+            runs = self.state['runs']
+            if runs and runs[-1] != self._logged_run:
+                record['run'] = [len(runs) - 1, runs[-1]]
+                self._logged_run = dict(runs[-1])
             
+            if filepath is not None:
+                record['file'] = filepath
+                record['file_state'] = self.state['files'][filepath]
+                self._touch(filepath)
+            
+            try:
+                os.write(self._log_fd, (_json_dumps(record) + '\n').encode('utf-8'))
             except Exception as e:
+                print(f"WARNING: Failed to log state change: {e}")
+            
+            self._dirty = True
+    
+    def _mark_logged(self):
+        """Take the current statistics and run as the base for change-log deltas"""
+        self._logged_stats = _flatten(self.state['statistics'])
+        runs = self.state['runs']
+        self._logged_run = dict(runs[-1]) if runs else None
+    
+    def flush(self, durable: bool = False):
+        """
+        Write pending state changes to disk immediately
+        
+        durable=True fsyncs the snapshot (end of run, shutdown, reset).
+        
+        Lock order is _io_lock then self.lock, so this must not be called
+        while holding self.lock (enforced). Signal handlers must not call it
+        either: the interrupted thread may hold _io_lock.
+        """
+        # RLock._is_owned: held by the calling thread (C and Python RLock)
+        if self.lock._is_owned():
+            raise RuntimeError("StateManager.flush() called while holding the state lock")
+        
+        with self._io_lock:
+            snapshot = None
+            try:
+                snapshot = self._take_snapshot()
+                if snapshot is not None:
+                    payload, shard_payloads = snapshot
+                    self._write_snapshot(payload, shard_payloads, durable)
+            except Exception as e:
+                with self.lock:
+                    self._dirty = True
+                    if snapshot is not None:
+                        self._dirty_shards.update(snapshot[1])
+                    # Disk contents are uncertain now; rewrite on the next snapshot
+                    self._master_digest = None
+                    self._shard_digests = {}
                 print(f"WARNING: Failed to save state: {e}")
     
-    def _get_file_hash(self, filepath: str) -> str:
-        """Get SHA256 hash of file to detect changes"""
+    def _flush_periodically(self):
+        """Flusher thread loop: write dirty state once per flush interval"""
+        while not self._stop_flusher.wait(self.flush_interval):
+            self.flush()
+    
+    def close(self):
+        """
+        Stop the flusher, write pending changes durably and release the
+        change-log fd (kept open for the manager's lifetime so mutations
+        are single O_APPEND writes). Safe to call more than once.
+        """
+        if self._stop_flusher.is_set():
+            return
+        self._stop_flusher.set()
+        self.flush(durable=True)
+        
+        with self._io_lock, self.lock:
+            os.close(self._log_fd)
+            self._log_fd = None
+        atexit.unregister(self.close)
+    
+    def _get_file_hash(self, filepath: str, st: Optional[os.stat_result] = None) -> str:
+        """
+        Get SHA256 hash of file to detect changes
+        
+        Digests are cached in the state keyed on (mtime, size), so a file
+        that has not been touched since the last run is only stat()ed.
+        Only the cache lookup and store take the lock, so call this before
+        acquiring self.lock to keep file reads out of the critical section.
+        Callers that already stat()ed the file can pass the result in.
+        """
+        if st is None:
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                return ''
+        
+        self._hydrate_path(filepath)
+        with self.lock:
+            hash_cache = self.state.setdefault('hash_cache', {})
+            cached = hash_cache.get(filepath)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                return cached[2]
+        
         try:
-            with open(filepath, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()[:16]
+            # Reuse the digest the shared read cache already computed.
+            # Only used for change detection; SHA256 (truncated to 16
+            # chars) is kept so hashes recorded by earlier runs still match
+            digest = FileCache.digest(filepath)[:16]
         except:
             return ''
+        
+        with self.lock:
+            self.state.setdefault('hash_cache', {})[filepath] = [st.st_mtime_ns, st.st_size, digest]
+            self._touch(filepath)
+            self._dirty = True
+        return digest
     
-    def _get_file_state(self, filepath: str) -> Dict:
-        """Get or create file state with enhanced tracking"""
-        if filepath not in self.state['files']:
-            self.state['files'][filepath] = {
+    def precompute_hashes(self, filepaths: List[str], max_workers: int = 8):
+        """
+        Hash files in parallel ahead of should_process()
+        
+        Fills the hash cache so the per-file checks that follow only stat
+        each file.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for _ in pool.map(self._get_file_hash, filepaths):
+                pass
+    
+    def _get_file_state(self, filepath: str, file_hash: Optional[str] = None) -> Dict:
+        """
+        Get or create file state with enhanced tracking
+        
+        Pass file_hash when the caller computed it before taking the lock;
+        otherwise a new entry hashes the file here, under the lock.
+        """
+        self._hydrate_path(filepath)
+        file_state = self.state['files'].get(filepath)
+        if file_state is None:
+            # A plain literal is the cheapest fresh nested dict (~13x faster
+            # than deep-copying a template) and serializes as-is
+            file_state = self.state['files'][filepath] = {
                 'status': 'pending',
-                'file_hash': self._get_file_hash(filepath),
+                'file_hash': self._get_file_hash(filepath) if file_hash is None else file_hash,
                 'detection': {'completed': False},
                 'refactoring': {
                     'gemini': {
@@ -169,10 +659,44 @@ class StateManager:
                     }
                 },
                 'attempts': 0,
-                'created_at': datetime.now().isoformat()
+                'created_at': time.time_ns()
             }
+            if self._pending_count is not None:
+                self._pending_count += 1
+            self._touch(filepath)
+            self._dirty = True
         
-        return self.state['files'][filepath]
+        return file_state
+    
+    def _is_pending(self, file_state: Dict) -> bool:
+        """Whether a file still counts as pending/retryable in the summary"""
+        return file_state['status'] in ('pending', 'processing') and file_state['attempts'] < self.max_retries
+    
+    def _count_pending(self) -> int:
+        """Full scan for the pending count (the running counter is seeded from this)"""
+        self._hydrate_all()
+        return sum(1 for f in self.state['files'].values() if self._is_pending(f))
+    
+    def _ensure_indexes(self):
+        """Seed the pending count and failed index from a full scan on first use"""
+        with self.lock:
+            if self._pending_count is None:
+                self._pending_count = self._count_pending()
+                self._failed_files = {
+                    filepath for filepath, file_state in self.state['files'].items()
+                    if file_state['status'] == 'failed'
+                }
+    
+    def _status_changed(self, filepath: str, file_state: Dict, was_pending: bool):
+        """Update the pending count and failed index after a status transition"""
+        if self._pending_count is None:
+            # Not seeded yet; the first full scan will see this transition
+            return
+        self._pending_count += self._is_pending(file_state) - was_pending
+        if file_state['status'] == 'failed':
+            self._failed_files.add(filepath)
+        else:
+            self._failed_files.discard(filepath)
     
     # Public API
     
@@ -183,21 +707,33 @@ class StateManager:
         Returns:
             (should_process, reason)
         """
+        # One stat() serves the existence check and the hash-cache lookup;
+        # the hash is computed before taking the lock
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            st = None
+        file_hash = self._get_file_hash(filepath, st) if st is not None else ''
+        
         with self.lock:
-            file_state = self._get_file_state(filepath)
+            file_state = self._get_file_state(filepath, file_hash)
             
             # Check if file exists
-            if not os.path.exists(filepath):
+            if st is None:
                 return False, 'file_not_found'
             
             # Check if completed
             if file_state['status'] == 'completed':
-                # Check if file changed
-                current_hash = self._get_file_hash(filepath)
+                # Check if file changed (unchanged mtime/size skipped the read)
+                current_hash = file_hash
                 if current_hash != file_state.get('file_hash', ''):
                     print(f"WARNING: File changed since last run, re-processing...")
                     file_state['status'] = 'pending'
                     file_state['file_hash'] = current_hash
+                    if self._pending_count is not None:
+                        self._pending_count += self._is_pending(file_state)
+                    self._touch(filepath)
+                    self._dirty = True
                     return True, 'file_changed'
                 
                 return False, 'already_completed'
@@ -211,48 +747,80 @@ class StateManager:
     
     def start_processing(self, filepath: str) -> Dict:
         """Mark file as started, return file state"""
+        # A file not seen by should_process() gets its hash outside the lock
+        self._hydrate_path(filepath)
+        file_hash = None if filepath in self.state['files'] else self._get_file_hash(filepath)
+        
         with self.lock:
-            file_state = self._get_file_state(filepath)
+            file_state = self._get_file_state(filepath, file_hash)
+            was_pending = self._is_pending(file_state)
             file_state['attempts'] += 1
             file_state['status'] = 'processing'
-            file_state['last_attempt'] = datetime.now().isoformat()
+            file_state['last_attempt'] = time.time_ns()
             file_state['start_time'] = time.time()
             
-            self._save_state()
+            self._status_changed(filepath, file_state, was_pending)
+            self._record_change(filepath)
             return file_state
     
     def track_smell_stats(self, smells):
         """Track which smells are detected most frequently"""
+        if not smells:
+            return
+        
+        # Tally outside the lock, then merge one entry per (type, severity)
+        tally = Counter((smell['type'], _SEVERITY_IDX.get(smell.get('severity'), 1)) for smell in smells)
+        
         with self.lock:
-            breakdown = self.state['statistics'].get('smell_breakdown', {})
-            
-            for smell in smells:
-                smell_type = smell['type']
-                if smell_type not in breakdown:
-                    breakdown[smell_type] = {
-                        'count': 0,
-                        'severity_breakdown': {'low': 0, 'medium': 0, 'high': 0}
-                    }
-                breakdown[smell_type]['count'] += 1
-                severity = smell.get('severity', 'medium')
-                breakdown[smell_type]['severity_breakdown'][severity] += 1
-            
-            self.state['statistics']['smell_breakdown'] = breakdown
-            self._save_state()
-    def mark_detection_complete(self, filepath: str, has_smells: bool):
-        """Mark smell detection phase as complete"""
+            breakdown = self.state['statistics'].setdefault('smell_breakdown', {})
+            
+            for (smell_type, severity), count in tally.items():
+                entry = breakdown.get(smell_type)
+                if entry is None:
+                    # sev: [low, medium, high] counts
+                    entry = breakdown[smell_type] = {'count': 0, 'sev': [0, 0, 0]}
+                elif 'sev' not in entry:
+                    # {'low': n, ...} buckets from an older state file
+                    sev = [0, 0, 0]
+                    for level, n in entry.pop('severity_breakdown', {}).items():
+                        sev[_SEVERITY_IDX.get(level, 1)] += n
+                    entry['sev'] = sev
+                entry['count'] += count
+                entry['sev'][severity] += count
+            
+            self._record_change()
+    
+    def needs_detection(self, filepath: str) -> bool:
+        """
+        Whether the detection phase still has to run for a file
+        
+        Lock-free: a single dict lookup, and mutators replace the detection
+        entry wholesale, so a reader sees either the old or the new one.
+        """
+        self._hydrate_path(filepath)
+        file_state = self.state['files'].get(filepath)
+        return not (file_state and file_state['detection']['completed'])
+    
+    def mark_detection_complete(self, filepath: str, has_smells: bool, api_call: bool = True):
+        """
+        Mark smell detection phase as complete
+        
+        api_call=False for results served from the response cache, which
+        are not counted as API calls.
+        """
         with self.lock:
             file_state = self._get_file_state(filepath)
             file_state['detection'] = {
                 'completed': True,
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': time.time_ns(),
                 'has_smells': has_smells
             }
             
             # Track API call
-            self.state['statistics']['api_calls']['gemini_flash'] += 1
+            if api_call:
+                self.state['statistics']['api_calls']['gemini_flash'] += 1
             
-            self._save_state()
+            self._record_change(filepath)
     
     def mark_refactoring_complete(self, filepath: str, model: str, pr_number: Optional[int] = None, pr_url: Optional[str] = None, is_comment_only: bool = False):
         """Mark refactoring for specific model as complete"""
@@ -261,7 +829,7 @@ class StateManager:
             
             file_state['refactoring'][model] = {
                 'completed': True,
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': time.time_ns(),
                 'is_comment_only': is_comment_only  # NEW
             }
             
@@ -273,14 +841,15 @@ class StateManager:
             if model == 'gemini':
                 self.state['statistics']['api_calls']['gemini_pro'] += 1
             
-            self._save_state()
+            self._record_change(filepath)
     
     def mark_completed(self, filepath: str):
         """Mark file as fully completed with enhanced tracking"""
         with self.lock:
             file_state = self._get_file_state(filepath)
+            was_pending = self._is_pending(file_state)
             file_state['status'] = 'completed'
-            file_state['completed_at'] = datetime.now().isoformat()
+            file_state['completed_at'] = time.time_ns()
             
             # Calculate processing time
             if 'start_time' in file_state:
@@ -289,6 +858,8 @@ class StateManager:
                 self.state['statistics']['total_processing_time_seconds'] += int(duration)
                 del file_state['start_time']
             
+            self._status_changed(filepath, file_state, was_pending)
+            
             # Update statistics
             self.state['statistics']['completed'] += 1
             self.state['statistics']['total_files_processed'] += 1
@@ -312,42 +883,48 @@ class StateManager:
                 runs[-1]['files_processed'] += 1
                 runs[-1]['prs_created'] += prs
             
-            self._save_state()
-            print(f"Saved progress: {os.path.basename(filepath)}")
+            self._record_change(filepath)
+            print(f"Saved progress: {_basename(filepath)}")
     
     def mark_failed(self, filepath: str, error: str, phase: str = 'unknown'):
         """Mark file as failed"""
         with self.lock:
             file_state = self._get_file_state(filepath)
+            was_pending = self._is_pending(file_state)
             file_state['last_error'] = str(error)
             file_state['failed_phase'] = phase
-            file_state['last_failed'] = datetime.now().isoformat()
+            file_state['last_failed'] = time.time_ns()
             
             # Check if should give up
             if file_state['attempts'] >= self.max_retries:
                 file_state['status'] = 'failed'
                 self.state['statistics']['failed'] += 1
-                print(f"Marked as failed: {os.path.basename(filepath)} (max retries exceeded)")
+                print(f"Marked as failed: {_basename(filepath)} (max retries exceeded)")
             else:
                 file_state['status'] = 'pending'  # Will retry
-                print(f"Failed (attempt {file_state['attempts']}/{self.max_retries}): {os.path.basename(filepath)}")
+                print(f"Failed (attempt {file_state['attempts']}/{self.max_retries}): {_basename(filepath)}")
+            
+            self._status_changed(filepath, file_state, was_pending)
             
             # Clean up timing
             if 'start_time' in file_state:
                 del file_state['start_time']
             
-            self._save_state()
+            self._record_change(filepath)
     
     def mark_skipped(self, filepath: str, reason: str):
         """Mark file as skipped"""
         with self.lock:
             file_state = self._get_file_state(filepath)
+            was_pending = self._is_pending(file_state)
             file_state['status'] = 'skipped'
             file_state['skip_reason'] = reason
-            file_state['skipped_at'] = datetime.now().isoformat()
+            file_state['skipped_at'] = time.time_ns()
+            
+            self._status_changed(filepath, file_state, was_pending)
             
             self.state['statistics']['skipped'] += 1
-            self._save_state()
+            self._record_change(filepath)
     
     def complete_run(self):
         """Mark current run as complete"""
@@ -355,25 +932,23 @@ class StateManager:
             runs = self.state['runs']
             if runs and 'completed_at' not in runs[-1]:
                 runs[-1]['completed_at'] = datetime.now().isoformat()
-                self._save_state()
+                self._dirty = True
+        
+        # Push out any coalesced updates, durably: this is the end of the run
+        self.flush(durable=True)
     
     def get_summary(self) -> Dict:
         """Get current state summary"""
+        self._ensure_indexes()
         with self.lock:
             stats = self.state['statistics']
             
-            # Files that can be retried
-            pending = sum(
-                1 for f in self.state['files'].values()
-                if f['status'] in ['pending', 'processing'] and f['attempts'] < self.max_retries
-            )
-            
             return {
                 'total_discovered': len(self.state['files']),
                 'completed': stats['completed'],
                 'failed': stats['failed'],
                 'skipped': stats['skipped'],
-                'pending': pending,
+                'pending': self._pending_count,
                 'prs_created': stats['prs_created'],
                 'api_calls': stats['api_calls'],
                 'processing_time': stats['total_processing_time_seconds']
@@ -405,25 +980,37 @@ class StateManager:
     
     def reset(self):
         """Clear all state (use with caution!)"""
-        with self.lock:
-            self.state = self._create_new_state()
-            self._save_state()
-            print("State reset complete")
+        # _io_lock first (lock order) so no snapshot is writing shards meanwhile
+        with self._io_lock, self.lock:
+            self.state = self._fresh_state()
+            self._pending_count = 0
+            self._failed_files = set()
+            self._mark_logged()
+            
+            # Logged changes belong to the discarded state
+            os.ftruncate(self._log_fd, 0)
+            if os.path.exists(self._rotated_log_file):
+                os.remove(self._rotated_log_file)
+        
+        self._save_state(force=True)
+        print("State reset complete")
     
     def get_failed_files(self) -> List[Dict]:
         """Get list of permanently failed files"""
+        self._ensure_indexes()
         with self.lock:
             failed = []
-            for filepath, state in self.state['files'].items():
-                if state['status'] == 'failed':
-                    failed.append({
-                        'file': filepath,
-                        'attempts': state['attempts'],
-                        'error': state.get('last_error', 'Unknown'),
-                        'phase': state.get('failed_phase', 'unknown')
-                    })
+            for filepath in self._failed_files:
+                state = self.state['files'][filepath]
+                failed.append({
+                    'file': filepath,
+                    'attempts': state['attempts'],
+                    'error': state.get('last_error', 'Unknown'),
+                    'phase': state.get('failed_phase', 'unknown'),
+                    'last_failed': _format_ts(state.get('last_failed'))
+                })
             return failed
     
     def has_previous_run(self) -> bool:
-        """Check if there's previous state to resume from"""
-        return len(self.state.get('files', {})) > 0
+        """Check if there's previous state to resume from (lock-free read)"""
+        return len(self.state.get('files', {})) > 0 or bool(self._unloaded_shards)